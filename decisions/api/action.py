@@ -1,10 +1,9 @@
 from django_filters import CharFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
 
 from decisions.models import Action, Attachment, Content
 
-from .base import BaseFilter, DataModelSerializer
+from .base import BaseFilter, DataModelSerializer, DataModelViewSet, FullTextSearchFilter
 
 
 class ContentSerializer(DataModelSerializer):
@@ -16,7 +15,7 @@ class ContentSerializer(DataModelSerializer):
 class AttachmentSerializer(DataModelSerializer):
     class Meta:
         model = Attachment
-        exclude = ('id', 'action', 'number')
+        exclude = ('id', 'action', 'number', 'fetched_url', 'etag', 'last_modified')
 
 
 class ActionFilter(BaseFilter):
@@ -37,10 +36,11 @@ class ActionSerializer(DataModelSerializer):
         fields = '__all__'
 
 
-class ActionViewSet(viewsets.ReadOnlyModelViewSet):
+class ActionViewSet(DataModelViewSet):
     queryset = Action.objects.select_related('data_source')
     queryset = queryset.prefetch_related('contents', 'contents__data_source', 'attachments')
     serializer_class = ActionSerializer
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
+    filter_backends = (DjangoFilterBackend, FullTextSearchFilter,)
     filter_class = ActionFilter
-    search_fields = ('title', 'contents__hypertext')
+    search_vector_field = 'search_vector'
+    validator_relations = ('contents', 'attachments')
@@ -1,5 +1,28 @@
+import hashlib
+import operator
+import pickle
+from calendar import timegm
+from functools import reduce
+
 import django_filters
-from rest_framework import serializers
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Max
+from django.template import loader
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import filters, serializers, viewsets
+from rest_framework.response import Response
+
+from decisions.models import DataSource
+from decisions.models.case import SEARCH_CONFIGS
+
+# Alias of the cache of API responses in settings.CACHES
+API_CACHE_ALIAS = 'api'
+
+# Responses pickling to more bytes than this are not cached, unless overridden in settings
+DEFAULT_MAX_CACHED_RESPONSE_SIZE = 256 * 1024
 
 
 class BaseFilter(django_filters.rest_framework.FilterSet):
@@ -13,3 +36,171 @@ class BaseFilter(django_filters.rest_framework.FilterSet):
 class DataModelSerializer(serializers.HyperlinkedModelSerializer):
     id = serializers.ReadOnlyField()
     data_source = serializers.SlugRelatedField('identifier', read_only=True)
+
+    # model fields used only by the importers and for searching
+    internal_fields = ('source_hash', 'search_vector')
+
+    def get_field_names(self, declared_fields, info):
+        field_names = super().get_field_names(declared_fields, info)
+        return [name for name in field_names if name not in self.internal_fields]
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Ranked full-text search of the ?search= terms in the search vectors of the view's model.
+
+    Views enable it with `search_vector_field`. The terms are matched with
+    every text search configuration the vectors are built with, and the
+    results are ordered by relevance.
+    """
+
+    def get_search_query(self, terms):
+        text = ' '.join(terms)
+        return reduce(operator.or_, (SearchQuery(text, config=config) for config in SEARCH_CONFIGS))
+
+    def filter_queryset(self, request, queryset, view):
+        field = getattr(view, 'search_vector_field', None)
+        terms = self.get_search_terms(request)
+        if not field or not terms:
+            return queryset
+
+        query = self.get_search_query(terms)
+        queryset = queryset.filter(**{field: query}).annotate(search_rank=SearchRank(F(field), query))
+        return queryset.order_by('-search_rank', 'pk')
+
+    def to_html(self, request, queryset, view):
+        if not getattr(view, 'search_vector_field', None):
+            return ''
+        terms = self.get_search_terms(request)
+        context = {'param': self.search_param, 'term': ' '.join(terms)}
+        return loader.get_template(self.template).render(context)
+
+
+class DataModelViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only viewset of a data model answering conditional GET requests from a cache.
+
+    The ETag and Last-Modified of a list come from the objects on the
+    returned page, their latest `modified_at` and that of their related
+    objects in `validator_relations`. Those of a single object come from
+    the object and its related objects. ETags also include the data source
+    generations. Nothing is aggregated over the whole list. Requests with a matching
+    If-None-Match or If-Modified-Since get 304 Not Modified without
+    anything being serialized.
+
+    The serialized data and validators are cached by the URL and the
+    generations of the data sources, so a response is only built again
+    once an import has changed the data. Responses larger than
+    `API_MAX_CACHED_RESPONSE_SIZE` bytes are not cached.
+    """
+    # Relations whose objects are included in the representation, e.g. nested or linked to
+    validator_relations = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, self.get_list_representation)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request, self.get_object_representation)
+
+    def get_list_representation(self, request, generations):
+        """
+        Return the ETag and Last-Modified of the list and a function building a response with it.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        pks = [row.pk for row in rows]
+        last_modified = self.get_last_modified(pks, [row.modified_at for row in rows])
+
+        def build():
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(rows, many=True).data)
+
+        return self.get_validators(request, generations, pks, last_modified) + (build,)
+
+    def get_object_representation(self, request, generations):
+        """
+        Return the ETag and Last-Modified of the object and a function building a response with it.
+        """
+        instance = self.get_object()
+        last_modified = self.get_last_modified([instance.pk], [instance.modified_at])
+
+        def build():
+            return Response(self.get_serializer(instance).data)
+
+        return self.get_validators(request, generations, instance.pk, last_modified) + (build,)
+
+    def get_last_modified(self, pks, times):
+        """
+        Return the latest of times and the modification times of the related objects of the objects with pks.
+        """
+        times = list(times)
+        if pks:
+            queryset = self.get_queryset().filter(pk__in=pks).order_by()
+            # One query per relation, joining them all at once would multiply the rows
+            for name in self.validator_relations:
+                times.append(queryset.aggregate(last_modified=Max('%s__modified_at' % name))['last_modified'])
+        times = [time for time in times if time is not None]
+        return max(times) if times else None
+
+    def get_validators(self, request, generations, identity, last_modified):
+        """
+        Return the ETag and the Last-Modified timestamp of a representation.
+
+        identity tells the representation apart from others modified at the
+        same time, i.e. the ids of the objects of a list page or the id of an
+        object. The ETag also changes with the data source generations, which
+        catch changes not raising any `modified_at`, like deleted related
+        objects or the count and other pages of a list.
+        """
+        # The representation also depends on the negotiated format and the API version
+        key = [request.accepted_renderer.format, request.version, generations, identity,
+               last_modified.isoformat() if last_modified else None]
+        etag = 'W/"%s"' % hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+        return etag, timestamp
+
+    def get_generations(self):
+        return list(DataSource.objects.order_by('pk').values_list('pk', 'generation'))
+
+    def get_cache_key(self, request, generations):
+        key = [request.build_absolute_uri(), request.accepted_renderer.format, request.version, generations]
+        return 'response:%s' % hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+
+    def get_cached_response(self, request, get_representation):
+        """
+        Return the response to request from the cache, or built with get_representation and cached.
+
+        The response is 304 Not Modified, or 412 Precondition Failed for a
+        failed If-Match, if the validators of the representation make it
+        unnecessary.
+        """
+        cache = caches[API_CACHE_ALIAS]
+        generations = self.get_generations()
+        key = self.get_cache_key(request, generations)
+        cached = cache.get(key)
+        if cached is not None:
+            data, etag, last_modified = cached
+
+            def build():
+                return Response(data)
+        else:
+            etag, last_modified, build_uncached = get_representation(request, generations)
+
+            def build():
+                response = build_uncached()
+                value = (response.data, etag, last_modified)
+                # Bounds the memory used by the cache to its number of entries times the maximum size
+                max_size = getattr(settings, 'API_MAX_CACHED_RESPONSE_SIZE', DEFAULT_MAX_CACHED_RESPONSE_SIZE)
+                if len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) <= max_size:
+                    cache.set(key, value)
+                return response
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -1,10 +1,10 @@
 from django_filters import CharFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, serializers, viewsets
+from rest_framework import serializers
 
 from decisions.models import Action, Case, CaseGeometry
 
-from .base import BaseFilter, DataModelSerializer
+from .base import BaseFilter, DataModelSerializer, DataModelViewSet, FullTextSearchFilter
 
 
 class CaseGeometrySerializer(DataModelSerializer):
@@ -31,9 +31,10 @@ class CaseSerializer(DataModelSerializer):
         fields = '__all__'
 
 
-class CaseViewSet(viewsets.ReadOnlyModelViewSet):
+class CaseViewSet(DataModelViewSet):
     queryset = Case.objects.select_related('data_source').prefetch_related('actions', 'attachments')
     serializer_class = CaseSerializer
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
+    filter_backends = (DjangoFilterBackend, FullTextSearchFilter,)
     filter_class = CaseFilter
-    search_fields = ('title', 'summary')
+    search_vector_field = 'search_vector'
+    validator_relations = ('actions', 'attachments', 'geometries')
@@ -1,8 +1,6 @@
-from rest_framework import viewsets
-
 from decisions.models import Function
 
-from .base import DataModelSerializer
+from .base import DataModelSerializer, DataModelViewSet
 
 
 class FunctionSerializer(DataModelSerializer):
@@ -11,6 +9,6 @@ class FunctionSerializer(DataModelSerializer):
         fields = '__all__'
 
 
-class FunctionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Function.objects.select_related('data_source', 'parent', 'parent__parent', 'parent__parent__parent')
+class FunctionViewSet(DataModelViewSet):
+    queryset = Function.objects.select_related('data_source')
     serializer_class = FunctionSerializer
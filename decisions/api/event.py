@@ -1,9 +1,9 @@
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import serializers, viewsets
+from rest_framework import serializers
 
 from decisions.models import Action, Event
 
-from .base import BaseFilter, DataModelSerializer
+from .base import BaseFilter, DataModelSerializer, DataModelViewSet
 
 
 class EventFilter(BaseFilter):
@@ -20,8 +20,10 @@ class EventSerializer(DataModelSerializer):
         fields = '__all__'
 
 
-class EventViewSet(viewsets.ReadOnlyModelViewSet):
+class EventViewSet(DataModelViewSet):
     queryset = Event.objects.select_related('data_source').prefetch_related('actions',)
     serializer_class = EventSerializer
     filter_backends = (DjangoFilterBackend,)
     filter_class = EventFilter
+    keyset_ordering = ('start_date', 'id')
+    validator_relations = ('actions',)
@@ -1,8 +1,8 @@
-from rest_framework import serializers, viewsets
+from rest_framework import serializers
 
 from decisions.models import Event, OrganizationClass, Organization, Post
 
-from .base import DataModelSerializer
+from .base import DataModelSerializer, DataModelViewSet
 
 
 class OrganizationClassSerializer(serializers.ModelSerializer):
@@ -21,6 +21,7 @@ class OrganizationSerializer(DataModelSerializer):
         fields = '__all__'
 
 
-class OrganizationViewSet(viewsets.ReadOnlyModelViewSet):
+class OrganizationViewSet(DataModelViewSet):
     queryset = Organization.objects.select_related('data_source').prefetch_related('events', 'posts')
     serializer_class = OrganizationSerializer
+    validator_relations = ('events', 'posts')
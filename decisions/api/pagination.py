@@ -0,0 +1,195 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import _positive_int, BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Ordering of keyset pagination unless a view sets `keyset_ordering`, covered by an index of every model
+DEFAULT_KEYSET_ORDERING = ('modified_at', 'id')
+
+# Result sets estimated to be at least this large are not counted exactly, unless overridden in settings
+DEFAULT_ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+def estimate_count(queryset):
+    """
+    Return the query planner's estimate of the number of objects in queryset.
+
+    The estimate of an unfiltered queryset comes from the table statistics,
+    others from the plan of the query.
+    """
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # Tables that have never been analyzed have no statistics
+            if row and row[0] > 0:
+                return int(row[0])
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination by the position of the first or last object of the current page in a stable ordering.
+
+    The ordering is `keyset_ordering` of the view and must end with a unique
+    field. Pages are fetched by comparing the ordering columns as a row to
+    the position in the cursor, which an index on the same columns answers
+    with a range scan. Nothing is counted, so every page costs the same.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 1000
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        ordering = getattr(view, 'keyset_ordering', DEFAULT_KEYSET_ORDERING)
+        self.fields = [self.model._meta.get_field(name) for name in ordering]
+        self.limit = self.get_limit(request)
+        position, self.reverse = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*(('-' if self.reverse else '') + field.name for field in self.fields))
+        if position is not None:
+            columns = ['%s.%s' % (connection.ops.quote_name(self.model._meta.db_table),
+                                  connection.ops.quote_name(field.column)) for field in self.fields]
+            queryset = queryset.extra(where=['(%s) %s (%s)' % (
+                ', '.join(columns), '<' if self.reverse else '>', ', '.join(['%s'] * len(columns)))], params=position)
+
+        page = list(queryset[:self.limit + 1])
+        has_more = len(page) > self.limit
+        self.page = page[:self.limit]
+        if self.reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, position is not None
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params[self.limit_query_param], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        position = [field.value_to_string(obj) for field in self.fields]
+        payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), 'offset')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """
+        Return the position and direction of the cursor of request, or (None, False) on the first page.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            position = [field.to_python(value) for field, value in zip(self.fields, payload['p'])]
+            if len(position) != len(self.fields):
+                raise ValueError
+            return position, bool(payload['r'])
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class DefaultPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination, or keyset pagination with ?pagination=cursor or a ?cursor= from a previous page.
+
+    Result sets the query planner estimates to have at least
+    API_ESTIMATED_COUNT_THRESHOLD objects are not counted. Their estimated
+    count is returned with count_estimated set, unless ?count=exact is
+    given.
+    """
+    pagination_query_param = 'pagination'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if request.query_params.get(self.pagination_query_param) == 'cursor' or \
+                KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        self.count, self.count_estimated = self.get_count(queryset, request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        # An estimate may be too low, so the page is fetched anyway
+        if not self.count_estimated and (self.count == 0 or self.offset > self.count):
+            self.page = []
+        else:
+            self.page = list(queryset[self.offset:self.offset + self.limit])
+        return self.page
+
+    def get_count(self, queryset, request):
+        """
+        Return the number of objects in queryset and whether it is an estimate.
+        """
+        if request.query_params.get(self.count_query_param) != 'exact':
+            threshold = getattr(settings, 'API_ESTIMATED_COUNT_THRESHOLD', DEFAULT_ESTIMATED_COUNT_THRESHOLD)
+            estimate = estimate_count(queryset)
+            if estimate >= threshold:
+                return estimate, True
+        return queryset.count(), False
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_estimated', self.count_estimated),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.count_estimated:
+            return super().get_next_link()
+        # There are more objects if the page is full
+        if len(self.page) < self.limit:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
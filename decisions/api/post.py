@@ -1,10 +1,10 @@
 from django_filters import CharFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import serializers, viewsets
+from rest_framework import serializers
 
 from decisions.models import Action, Post
 
-from .base import BaseFilter, DataModelSerializer
+from .base import BaseFilter, DataModelSerializer, DataModelViewSet
 
 
 class PostFilter(BaseFilter):
@@ -23,8 +23,9 @@ class PostSerializer(DataModelSerializer):
         fields = '__all__'
 
 
-class PostViewSet(viewsets.ReadOnlyModelViewSet):
+class PostViewSet(DataModelViewSet):
     queryset = Post.objects.select_related('data_source', 'organization').prefetch_related('actions',)
     serializer_class = PostSerializer
+    validator_relations = ('actions',)
     filter_backends = (DjangoFilterBackend,)
     filter_class = PostFilter
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import zipfile
+
+
+class ZipArchive(object):
+    """
+    Read-only, directory-like access to the members of a zip file.
+
+    The member list is indexed once when the archive is opened, so checking
+    for files and listing directories never scans the archive again, and
+    members are decoded straight from the archive without extracting them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.zip_file = zipfile.ZipFile(path, 'r')
+        self.files = {}
+        self.directories = {'': set()}
+
+        for info in self.zip_file.infolist():
+            name = info.filename.strip('/')
+            if not name:
+                continue
+            if not info.filename.endswith('/'):
+                self.files[name] = info
+            parts = name.split('/')
+            for i in range(1, len(parts)):
+                self.directories.setdefault('/'.join(parts[:i]), set())
+            for i in range(len(parts)):
+                self.directories['/'.join(parts[:i])].add(parts[i])
+            if info.filename.endswith('/'):
+                self.directories.setdefault(name, set())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.zip_file.close()
+
+    def isfile(self, path):
+        return path in self.files
+
+    def isdir(self, path):
+        return path in self.directories
+
+    def exists(self, path):
+        return self.isfile(path) or self.isdir(path)
+
+    def listdir(self, path):
+        """
+        Return the sorted names of the entries in the given directory.
+        """
+        return sorted(self.directories[path.strip('/')])
+
+    def getinfo(self, path):
+        return self.files[path]
+
+    def load_json(self, path):
+        with self.zip_file.open(self.files[path]) as member:
+            return json.load(io.TextIOWrapper(member, encoding='utf-8'))
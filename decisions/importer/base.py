@@ -1,7 +1,312 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
 import logging
+import os
+from collections import defaultdict, namedtuple, OrderedDict
+from contextlib import contextmanager
+from itertools import islice
 
-from decisions.models import Membership, Organization, Person, Post
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connection, DatabaseError, models, transaction
+from django.utils import timezone
+
+from decisions.models import Action, Case, DataSource, ImportCheckpoint, Membership, Organization, Person, Post
+
+from .flush import flush_data_source, get_cascade
+from .stats import ImportStats
+from .validation import ValidationIndex
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Errors of a record handler that skip the record instead of failing the import
+INVALID_RECORD_ERRORS = (KeyError, TypeError, ValueError, ValidationError, ObjectDoesNotExist, DatabaseError)
+
+
+class Ref(namedtuple('Ref', ('model', 'origin_id', 'required'))):
+    """
+    Reference to an object by its origin_id.
+
+    Refs can be used as foreign key values of upserted objects. They are
+    resolved to primary keys only when the batch containing them is written.
+    If a required reference cannot be resolved the object is skipped, an
+    optional one is set to NULL until the upserter finishes, when it is
+    resolved again.
+    """
+    def __new__(cls, model, origin_id, required=True):
+        return super().__new__(cls, model, origin_id, required)
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+def source_hash(values):
+    """
+    Return a stable hash of the given normalised field values.
+
+    References are hashed by the origin_id of their target, so the hash
+    only depends on the source data and not on primary keys.
+    """
+    payload = json.dumps(values, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def get_default_fields(model, names):
+    """
+    Return the fields of model missing from names, set to their defaults when an object is created.
+
+    Existing objects keep their values of these fields.
+    """
+    excluded = set(names) | {'data_source', 'origin_id', 'created_at', 'modified_at'}
+    return [field for field in model._meta.concrete_fields if not field.primary_key and field.name not in excluded]
+
+
+class BulkUpserter(object):
+    """
+    Collects objects of one model and writes them in batches.
+
+    Every batch is written with multi-row
+    INSERT ... ON CONFLICT (data_source_id, origin_id) DO UPDATE
+    statements, so the cost of a batch does not depend on how many of its
+    objects already exist. Objects whose source_hash matches the stored one
+    are not written at all.
+    """
+
+    def __init__(self, model, data_source, resolve, on_write, logger, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.data_source = data_source
+        self.resolve = resolve
+        self.on_write = on_write
+        self.logger = logger
+        self.batch_size = batch_size
+        self.pending = OrderedDict()
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        # origin_id -> (values to hash, [(name, Ref)]) of objects written without their optional references
+        self.unresolved = OrderedDict()
+
+    def add(self, origin_id, values):
+        self.pending[origin_id] = values
+
+    def is_full(self):
+        return len(self.pending) >= self.batch_size
+
+    def flush(self):
+        rows = self.pending
+        self.pending = OrderedDict()
+
+        # Objects referring to other objects of the same batch (e.g. parents)
+        # are written in later rounds, after their targets have been written.
+        while rows:
+            ready = []
+            deferred = OrderedDict()
+            for origin_id, values in rows.items():
+                try:
+                    resolved, hashed = self._resolve_values(origin_id, values, rows)
+                except UnresolvedReference as e:
+                    self.logger.error('Cannot import %s %s, %s %s does not exist' % (
+                        self.model.__name__, origin_id, e.args[0].model.__name__, e.args[0].origin_id))
+                    self.skipped += 1
+                    continue
+                if resolved is None:
+                    deferred[origin_id] = values
+                else:
+                    ready.append((origin_id, resolved, source_hash(hashed)))
+
+            if not ready:
+                for origin_id in deferred:
+                    self.logger.error('Cannot import %s %s, it has a circular reference' % (
+                        self.model.__name__, origin_id))
+                    self.skipped += 1
+                break
+
+            self._write(ready)
+            rows = deferred
+
+    def finish(self):
+        """
+        Write everything still pending, called once the model has been fully imported.
+
+        Optional references of written objects are then set if their targets
+        were written after them, e.g. parents in a later batch. Those still
+        missing are left in `unresolved`.
+        """
+        self.flush()
+        self._set_unresolved()
+
+    def _set_unresolved(self):
+        unresolved = self.unresolved
+        self.unresolved = OrderedDict()
+        for origin_id, (hashed, refs) in unresolved.items():
+            values = {}
+            for name, ref in refs:
+                pk = self.resolve(ref)
+                if pk is None:
+                    self.unresolved.setdefault(origin_id, (hashed, []))[1].append((name, ref))
+                    continue
+                values[self.model._meta.get_field(name).attname] = pk
+                hashed[name] = ref.origin_id
+            if values:
+                self.model.objects.filter(data_source=self.data_source, origin_id=origin_id).update(
+                    source_hash=source_hash(hashed), modified_at=timezone.now(), **values)
+
+    def _resolve_values(self, origin_id, values, batch):
+        """
+        Return (resolved values, values to hash), or (None, None) if the object has to wait for the batch.
+        """
+        resolved = {}
+        hashed = {}
+        unresolved = []
+        for name, value in values.items():
+            hashed[name] = value
+            if isinstance(value, Ref):
+                pk = self.resolve(value)
+                if pk is None and value.model is self.model and value.origin_id in batch:
+                    return None, None
+                if pk is None:
+                    if value.required:
+                        raise UnresolvedReference(value)
+                    unresolved.append((name, value))
+                hashed[name] = value.origin_id if pk is not None else None
+                value = pk
+            elif isinstance(value, models.Model):
+                value = hashed[name] = value.pk
+            resolved[name] = value
+
+        self.unresolved.pop(origin_id, None)
+        if unresolved:
+            self.unresolved[origin_id] = (hashed, unresolved)
+        return resolved, hashed
+
+    def _exclude_unchanged(self, rows):
+        hashes = OrderedDict((origin_id, row_hash) for origin_id, values, row_hash in rows)
+        existing = self.model.objects.filter(data_source=self.data_source, origin_id__in=list(hashes))
+
+        unchanged = set()
+        for origin_id, pk, existing_hash in existing.values_list('origin_id', 'pk', 'source_hash'):
+            if existing_hash == hashes[origin_id]:
+                unchanged.add(origin_id)
+                self.on_write(self.model, origin_id, pk)
+        self.unchanged += len(unchanged)
+
+        return [(origin_id, dict(values, source_hash=row_hash))
+                for origin_id, values, row_hash in rows if origin_id not in unchanged]
+
+    def _write(self, rows):
+        rows = self._exclude_unchanged(rows)
+
+        groups = OrderedDict()
+        for origin_id, values in rows:
+            groups.setdefault(tuple(sorted(values)), []).append((origin_id, values))
+
+        for names, group in groups.items():
+            fields = [self.model._meta.get_field(name) for name in names]
+            default_fields = get_default_fields(self.model, names)
+            prepared = []
+            for origin_id, values in group:
+                row = [values[name] for name in names] + [field.get_default() for field in default_fields]
+                try:
+                    prepared.append(self._prepare_row(origin_id, row, fields + default_fields))
+                except (TypeError, ValueError, ValidationError) as e:
+                    self.logger.error('Cannot import %s %s, invalid value: %s' % (self.model.__name__, origin_id, e))
+                    self.skipped += 1
+            if prepared:
+                self._save_rows(fields, default_fields, prepared)
+
+    def _prepare_row(self, origin_id, values, fields):
+        placeholders = []
+        params = []
+        for value, field in zip(values, fields):
+            value = field.get_db_prep_save(value, connection)
+            if hasattr(field, 'get_placeholder'):
+                placeholders.append(field.get_placeholder(value, None, connection))
+            else:
+                placeholders.append('%s')
+            params.append(value)
+        return origin_id, placeholders, params
+
+    def _save_rows(self, fields, default_fields, rows):
+        try:
+            with transaction.atomic():
+                results = self._execute(fields, default_fields, rows)
+        except DatabaseError as e:
+            if len(rows) == 1:
+                self.logger.error('Cannot import %s %s: %s' % (self.model.__name__, rows[0][0], e))
+                self.skipped += 1
+                return
+            # Retry the rows one by one, each in its own savepoint, to skip only the failing ones
+            for row in rows:
+                self._save_rows(fields, default_fields, [row])
+            return
+
+        for origin_id, pk, created in results:
+            self.on_write(self.model, origin_id, pk)
+            if created:
+                self.created += 1
+            else:
+                self.updated += 1
+
+    def _execute(self, fields, default_fields, rows):
+        quote = connection.ops.quote_name
+        now = timezone.now()
+
+        columns = ['data_source_id', 'origin_id', 'created_at', 'modified_at'] + [field.column for field in fields]
+        updated_columns = columns[3:]
+        columns += [field.column for field in default_fields]
+        value_sqls = []
+        params = []
+        for origin_id, placeholders, values in rows:
+            value_sqls.append('(%s)' % ', '.join(['%s'] * 4 + placeholders))
+            params.extend([self.data_source.pk, origin_id, now, now])
+            params.extend(values)
+
+        sql = 'INSERT INTO {table} ({columns}) VALUES {values} ' \
+              'ON CONFLICT ({data_source}, {origin_id}) DO UPDATE SET {updates} ' \
+              'RETURNING {pk}, {origin_id}, xmax = 0'.format(
+                  table=quote(self.model._meta.db_table),
+                  columns=', '.join(quote(column) for column in columns),
+                  values=', '.join(value_sqls),
+                  data_source=quote('data_source_id'),
+                  origin_id=quote('origin_id'),
+                  updates=', '.join('{0} = EXCLUDED.{0}'.format(quote(column)) for column in updated_columns),
+                  pk=quote(self.model._meta.pk.column),
+              )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(origin_id, pk, created) for pk, origin_id, created in cursor.fetchall()]
+
+
+class ValidatingUpserter(object):
+    """
+    Records objects in a ValidationIndex instead of writing them.
+    """
+
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index
+        self.pending = index.origin_ids[model]
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.unresolved = OrderedDict()
+
+    def add(self, origin_id, values):
+        references = [(name, value) for name, value in values.items() if isinstance(value, Ref)]
+        self.index.add(self.model, origin_id, references)
+
+    def is_full(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        pass
 
 
 class Importer(object):
@@ -9,44 +314,428 @@ class Importer(object):
         super(Importer, self).__init__()
         self.options = options
         self.verbosity = options['verbosity']
+        self.batch_size = options.get('batch_size') or DEFAULT_BATCH_SIZE
         self.logger = logging.getLogger(__name__)
+        self.origin_id_maps = {}
+        self.upserters = OrderedDict()
+        self.pending_memberships = OrderedDict()
+        self.pending_m2m = OrderedDict()
+        self.stats = ImportStats(self._get_row_counts)
+        # With --validate-only objects are only indexed and checked, nothing is written
+        self.validation = ValidationIndex(self.get_origin_id_map) if options.get('validate_only') else None
+        # Progress of the import, see start_checkpoint
+        self.checkpoint = None
+        self.stage_position = 0
+        # Number of errors in the source data, see report_error
+        self.errors = 0
+        # Whether a record is being handled in a savepoint by run_in_batches
+        self.handling_record = False
 
         self.setup()
 
     def setup(self):
         pass
 
-    def _get_or_create_person(self, info):
-        person, created = Person.objects.get_or_create(
-            data_source=self.data_source,
-            origin_id=info['origin_id'],
-            defaults=info
-        )
-        if created:
-            self.logger.info('Created person {}'.format(person))
-
-        return person
-
-    def _save_membership(self, info, organization):
-        person_info = info.pop('person')
-        person = self._get_or_create_person(person_info)
-
-        membership = Membership.objects.create(
-            data_source=self.data_source,
-            person=person,
-            organization=organization,
-            role=info['role'],
-            start_date=info['start_date'],
-            end_date=info['end_date'],
+    @contextmanager
+    def stage(self, name):
+        """
+        Return a context manager recording the statistics of an import stage.
+
+        What a completed stage wrote is made visible in the API by bumping
+        the generation of the data source. `run_in_batches` bumps it with
+        every batch as well.
+        """
+        with self.stats.measure(name) as stage:
+            yield stage
+        self.bump_generation()
+
+    def bump_generation(self):
+        """
+        Invalidate the cached API responses, which are keyed on the generations of the data sources.
+        """
+        if self.validation or getattr(self, 'data_source', None) is None:
+            return
+        DataSource.bump_generations([self.data_source.pk])
+
+    def start_checkpoint(self, path):
+        """
+        Start recording the progress of importing the file at path.
+
+        With --resume the progress recorded by an earlier, interrupted import
+        of the same unchanged file is continued from instead.
+        """
+        if self.validation:
+            return
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        fingerprint = '%d:%d' % (stat.st_size, stat.st_mtime)
+        checkpoints = ImportCheckpoint.objects.filter(data_source=self.data_source, source=path)
+
+        checkpoint = checkpoints.first()
+        if checkpoint and self.options.get('resume'):
+            if checkpoint.fingerprint == fingerprint:
+                self.logger.info('Resuming import of %s, completed stages: %s' % (
+                    path, ', '.join(checkpoint.completed_stages) or 'none'))
+                self.checkpoint = checkpoint
+                return
+            self.logger.warning('%s has changed since the interrupted import, starting from the beginning' % path)
+        elif self.options.get('resume'):
+            self.logger.info('No interrupted import of %s to resume' % path)
+
+        checkpoints.delete()
+        self.checkpoint = ImportCheckpoint.objects.create(data_source=self.data_source, source=path,
+                                                          fingerprint=fingerprint)
+
+    def finish_checkpoint(self):
+        """
+        Forget the progress of a completed import.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.delete()
+            self.checkpoint = None
+
+    def run_stage(self, name, function, *args):
+        """
+        Run a stage of the import, unless an import being resumed already completed it.
+
+        The stage is completed once function returns. Records the stage
+        handles with `run_in_batches` are recorded as they are committed,
+        so a resumed import skips them.
+        """
+        checkpoint = self.checkpoint
+        if checkpoint is not None and name in checkpoint.completed_stages:
+            self.logger.info('Skipping stage %s, completed by the interrupted import' % name)
+            return
+        if checkpoint is not None and checkpoint.stage != name:
+            checkpoint.stage = name
+            checkpoint.position = 0
+
+        self.stage_position = 0
+        with self.stage(name):
+            function(*args)
+
+        if self.checkpoint is not None:
+            self.checkpoint.completed_stages.append(name)
+            self.checkpoint.stage = ''
+            self.checkpoint.position = 0
+            self.checkpoint.save()
+
+    def get_committed_position(self):
+        """
+        Return the number of records of the current stage committed by the import being resumed.
+        """
+        return self.checkpoint.position if self.checkpoint is not None else 0
+
+    def _get_row_counts(self):
+        upserters = self.upserters.values()
+        return (
+            sum(upserter.created + upserter.updated for upserter in upserters),
+            sum(upserter.unchanged for upserter in upserters),
+            sum(upserter.skipped for upserter in upserters),
         )
-        self.logger.info('Created membership {}'.format(membership))
 
-        return membership
+    def get_origin_id_queryset(self, model):
+        """
+        Return the queryset used for resolving origin_ids of the given model.
+
+        By default only objects of this importer's data source are considered.
+        """
+        return model.objects.filter(data_source=self.data_source)
+
+    def get_origin_id_map(self, model):
+        """
+        Return a dict mapping origin_id -> pk for the given model.
+
+        The map is filled with a single query on first use and it should be
+        kept up to date with `remember_origin_id` as objects are written.
+        """
+        if model not in self.origin_id_maps:
+            queryset = self.get_origin_id_queryset(model).exclude(origin_id=None)
+            self.origin_id_maps[model] = dict(queryset.values_list('origin_id', 'pk').iterator())
+        return self.origin_id_maps[model]
+
+    def remember_origin_id(self, obj):
+        self._remember_origin_id(type(obj), obj.origin_id, obj.pk)
+
+    def _remember_origin_id(self, model, origin_id, pk):
+        # maps are loaded lazily, an unloaded one will include this object when it is loaded
+        if model in self.origin_id_maps:
+            self.origin_id_maps[model][origin_id] = pk
+
+    def flush_data(self, *models):
+        """
+        Delete all objects of the given models imported from this importer's data source.
+
+        Objects referring to them are deleted as well, like the ORM would
+        cascade, but with one statement per table.
+        """
+        if self.validation:
+            # Validate against an empty database instead
+            self.clear_origin_id_maps()
+            for model in get_cascade(models)[0]:
+                self.origin_id_maps[model] = {}
+            return
+        flush_data_source(self.data_source, models, self.logger)
+        self.clear_origin_id_maps()
+        # Nothing imported before the flush is left to resume from
+        if self.checkpoint is not None:
+            self.checkpoint.completed_stages = []
+            self.checkpoint.position = 0
+            self.checkpoint.save()
+
+    def forget_origin_id_map(self, model):
+        """
+        Drop the origin_id map of the given model, it is reloaded on next use.
+        """
+        self.origin_id_maps.pop(model, None)
+
+    def clear_origin_id_maps(self):
+        self.origin_id_maps = {}
+        self.upserters = OrderedDict()
+
+    def get_upserter(self, model):
+        if model not in self.upserters and self.validation:
+            self.upserters[model] = ValidatingUpserter(model, self.validation)
+        if model not in self.upserters:
+            self.upserters[model] = BulkUpserter(
+                model, self.data_source, self.resolve, self._remember_origin_id, self.logger,
+                batch_size=self.batch_size,
+            )
+        return self.upserters[model]
+
+    def upsert(self, model, origin_id, values):
+        """
+        Queue an object of the given model to be created or updated.
+
+        Foreign keys in values may be given as Refs. The object is written
+        when its batch fills up, when something refers to it or when
+        `flush_upserts` is called.
+        """
+        upserter = self.get_upserter(model)
+        upserter.add(origin_id, values)
+        # A full batch of a record being handled waits for the record's savepoint, see _handle_record
+        if not self.handling_record and upserter.is_full():
+            upserter.flush()
+
+    def resolve(self, ref):
+        """
+        Return the pk of the object referred to by ref or None if there is no such object.
+        """
+        origin_ids = self.get_origin_id_map(ref.model)
+        if ref.origin_id not in origin_ids:
+            upserter = self.upserters.get(ref.model)
+            if upserter and ref.origin_id in upserter.pending:
+                upserter.flush()
+        return origin_ids.get(ref.origin_id)
+
+    def has_origin_id(self, model, origin_id):
+        if origin_id in self.get_origin_id_map(model):
+            return True
+        upserter = self.upserters.get(model)
+        return bool(upserter and origin_id in upserter.pending)
+
+    def flush_upserts(self, *models):
+        for model in models or list(self.upserters):
+            if model in self.upserters:
+                self.upserters[model].flush()
+
+    def flush_batch(self):
+        """
+        Write everything queued for the current batch.
+
+        Subclasses writing more than upserts per batch should extend this.
+        """
+        if self.validation:
+            self.pending_memberships = OrderedDict()
+            return
+        self.flush_upserts()
+        self._save_pending_memberships()
+        self._save_pending_m2m()
+
+    def set_m2m(self, model, field_name, origin_id, target_origin_ids):
+        """
+        Queue setting a many-to-many field of an object to the objects with the given origin_ids.
+
+        The relations of the whole batch are synchronised in bulk by
+        `flush_batch`. Targets that do not exist are ignored.
+        """
+        if self.validation:
+            related_model = model._meta.get_field(field_name).related_model
+            for target_origin_id in target_origin_ids:
+                self.validation.add_reference(Ref(related_model, target_origin_id),
+                                              '%s %s (%s)' % (model.__name__, origin_id, field_name))
+            return
+        self.pending_m2m.setdefault((model, field_name), OrderedDict())[origin_id] = target_origin_ids
+
+    def _save_pending_m2m(self):
+        for (model, field_name), relations in self.pending_m2m.items():
+            field = model._meta.get_field(field_name)
+            self._save_m2m(field, relations)
+        self.pending_m2m = OrderedDict()
+
+    def _save_m2m(self, field, relations):
+        """
+        Diff the given relations against the through table and add and remove rows in bulk.
+
+        Objects whose relations changed get a new `modified_at`, as their own
+        rows are left unchanged when their source_hash matches.
+        """
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+        desired = {}
+        for origin_id, target_origin_ids in relations.items():
+            pk = self.resolve(Ref(field.model, origin_id))
+            if pk is None:
+                continue
+            targets = (self.resolve(Ref(field.related_model, target_id)) for target_id in target_origin_ids)
+            desired[pk] = {target_pk for target_pk in targets if target_pk is not None}
+
+        to_delete = []
+        changed = set()
+        existing = through.objects.filter(**{'%s__in' % source: list(desired)}).values_list('pk', source, target)
+        for pk, source_pk, target_pk in existing:
+            if target_pk in desired[source_pk]:
+                desired[source_pk].remove(target_pk)
+            else:
+                to_delete.append(pk)
+                changed.add(source_pk)
+        changed.update(source_pk for source_pk, target_pks in desired.items() if target_pks)
+
+        if to_delete:
+            through.objects.filter(pk__in=to_delete).delete()
+        through.objects.bulk_create([through(**{source: source_pk, target: target_pk})
+                                     for source_pk, target_pks in desired.items() for target_pk in target_pks])
+        if changed:
+            field.model.objects.filter(pk__in=changed).update(modified_at=timezone.now())
+
+    def run_in_batches(self, records, handler, weight=None, omits_committed=False):
+        """
+        Call handler for each record, committing once per batch_size records.
+
+        Records are read outside of the transactions. Each record is handled
+        in a savepoint, so invalid records and records whose handler fails in
+        the database are logged and skipped, and so are rows the database
+        refuses to write, without losing the rest of their batch.
+
+        If weight is given, a record counts as weight(record) records
+        towards the batch size. The number of records of the stage committed
+        is saved in the checkpoint with each batch. When resuming, the
+        records committed by the interrupted import are read past, or
+        assumed to be left out of records already if omits_committed is true.
+        """
+        records = iter(records)
+        committed = self.get_committed_position()
+        if committed > self.stage_position:
+            count = committed - self.stage_position
+            if not omits_committed:
+                count = sum(1 for record in islice(records, count))
+            self.stage_position += count
+            self.logger.info('Skipping %d records committed by the interrupted import' % count)
+
+        while True:
+            batch = self._read_batch(records, weight)
+            if not batch:
+                break
+            self.stats.add_read(sum(weight(record) for record in batch) if weight else len(batch))
+            with transaction.atomic():
+                for record in batch:
+                    self._handle_record(handler, record)
+                self.flush_batch()
+                self.stage_position += len(batch)
+                self._save_position()
+                self.bump_generation()
+
+    def _handle_record(self, handler, record):
+        """
+        Call handler for record in a savepoint, skipping the record if it fails.
+
+        Upserters filling up meanwhile are only flushed after the savepoint,
+        so rolling back a failed record never discards rows of other records.
+        """
+        self.handling_record = True
+        try:
+            with transaction.atomic():
+                handler(record)
+        except INVALID_RECORD_ERRORS as e:
+            self.report_error('Skipping invalid record %s: %s' % (repr(record)[:200], e))
+        finally:
+            self.handling_record = False
+        for upserter in list(self.upserters.values()):
+            if upserter.is_full():
+                upserter.flush()
+
+    def _read_batch(self, records, weight):
+        if weight is None:
+            return list(islice(records, self.batch_size))
+        batch = []
+        size = 0
+        for record in records:
+            batch.append(record)
+            size += weight(record)
+            if size >= self.batch_size:
+                break
+        return batch
+
+    def _save_position(self):
+        if self.checkpoint is not None:
+            self.checkpoint.position = self.stage_position
+            self.checkpoint.save(update_fields=['stage', 'position', 'modified_at'])
+
+    def report_error(self, message):
+        """
+        Log an error in the source data, counting it as a problem when validating.
+        """
+        self.logger.error(message)
+        self.errors += 1
+        if self.validation:
+            self.validation.errors += 1
+
+    def finish_upserts(self, model):
+        upserter = self.get_upserter(model)
+        upserter.finish()
+        for origin_id, (hashed, refs) in upserter.unresolved.items():
+            for name, ref in refs:
+                self.report_error('Cannot set %s for %s %s, %s %s does not exist' % (
+                    name, model.__name__, origin_id, ref.model.__name__, ref.origin_id))
+        self.logger.info('%s: %d created, %d updated, %d unchanged, %d skipped' % (
+            model.__name__, upserter.created, upserter.updated, upserter.unchanged, upserter.skipped))
+
+    def rebuild_hierarchies(self, *models):
+        """
+        Recompute the stored full names and depths of the given hierarchical models written in bulk.
+        """
+        if self.validation:
+            return
+        for model in models:
+            count = model.rebuild_hierarchy()
+            if count:
+                self.logger.info('%s: %d full names updated' % (model.__name__, count))
+
+    def refresh_search_vectors(self):
+        """
+        Update the full-text search vectors of the cases and actions written by this import.
+        """
+        if self.validation:
+            return
+        # A resumed import includes what the interrupted one wrote
+        since = self.checkpoint.created_at if self.checkpoint is not None else self.stats.started_at
+        for model in (Case, Action):
+            count = model.refresh_search_vectors(since)
+            if count:
+                self.logger.info('%s: %d search vectors updated' % (model.__name__, count))
 
     def save_organization(self, info):
-        membership_infos = info.pop('memberships', [])
+        # Invalid membership dates are reported with the organization, not when its batch is flushed
+        date_field = Membership._meta.get_field('start_date')
+        membership_infos = [
+            dict(membership_info, start_date=date_field.to_python(membership_info['start_date']),
+                 end_date=date_field.to_python(membership_info['end_date']))
+            for membership_info in info.pop('memberships', [])
+        ]
 
-        defaults = {
+        values = {
             'name': info['name'],
             'founding_date': info['founding_date'],
             'classification': info['classification'],
@@ -55,28 +744,82 @@ class Importer(object):
 
         parent = info['parent']
         if parent:
-            try:
-                defaults['parent'] = Organization.objects.get(origin_id=parent)
-            except Organization.DoesNotExist:
-                self.logger.error('Cannot set parent for org %s, org with origin_id %s does not exist'
-                                  % (info['name'], parent))
-
-        organization, created = Organization.objects.update_or_create(
-            data_source=self.data_source,
-            origin_id=info['origin_id'],
-            defaults=defaults,
-        )
-        verb = 'Created' if created else 'Updated'
-        self.logger.info('{} organization {}'.format(verb, organization))
+            values['parent'] = Ref(Organization, parent, required=False)
 
-        organization.memberships.all().delete()
+        self.upsert(Organization, info['origin_id'], values)
+        self.pending_memberships[info['origin_id']] = membership_infos
+
+    def _queue_persons(self, membership_infos):
+        # Existing persons are left as they are
         for membership_info in membership_infos:
-            self._save_membership(membership_info, organization)
+            person_info = dict(membership_info['person'])
+            origin_id = person_info.pop('origin_id')
+            if not self.has_origin_id(Person, origin_id):
+                self.upsert(Person, origin_id, person_info)
+
+    def _save_pending_memberships(self):
+        """
+        Synchronise the memberships of the organizations saved in the current batch.
+
+        Memberships are matched by (person origin_id, role, start_date).
+        Matching memberships are only updated if their end date changed,
+        so unchanged memberships keep their rows and ids.
+        """
+        if not self.pending_memberships:
+            return
 
-        return organization
+        desired = {}
+        for origin_id, membership_infos in self.pending_memberships.items():
+            organization_id = self.resolve(Ref(Organization, origin_id))
+            if organization_id is None:
+                continue
+            self._queue_persons(membership_infos)
+            memberships = desired.setdefault(organization_id, {})
+            for info in membership_infos:
+                key = (info['person']['origin_id'], info['role'], info['start_date'])
+                memberships[key] = info
+        self.pending_memberships = OrderedDict()
+
+        existing = Membership.objects.filter(organization_id__in=list(desired)).values_list(
+            'pk', 'organization_id', 'person__origin_id', 'role', 'start_date', 'end_date')
+
+        to_delete = []
+        to_update = defaultdict(list)
+        for pk, organization_id, person_origin_id, role, start_date, end_date in existing:
+            info = desired[organization_id].pop((person_origin_id, role, start_date), None)
+            if info is None:
+                to_delete.append(pk)
+                continue
+            if info['end_date'] != end_date:
+                to_update[info['end_date']].append(pk)
+
+        to_create = []
+        for organization_id, memberships in desired.items():
+            for (person_origin_id, role, start_date), info in memberships.items():
+                person_id = self.resolve(Ref(Person, person_origin_id))
+                if person_id is None:
+                    continue
+                to_create.append(Membership(
+                    data_source=self.data_source,
+                    person_id=person_id,
+                    organization_id=organization_id,
+                    role=role,
+                    start_date=start_date,
+                    end_date=info['end_date'],
+                ))
+
+        if to_delete:
+            Membership.objects.filter(pk__in=to_delete).delete()
+        for end_date, pks in to_update.items():
+            Membership.objects.filter(pk__in=pks).update(end_date=end_date, modified_at=timezone.now())
+        Membership.objects.bulk_create(to_create)
+
+        if to_create or to_update or to_delete:
+            self.logger.info('Memberships: %d created, %d updated, %d deleted' % (
+                len(to_create), sum(len(pks) for pks in to_update.values()), len(to_delete)))
 
     def save_post(self, info):
-        defaults = {
+        values = {
             'label': info['name'],
             'start_date': info['founding_date'],
             'end_date': info['dissolution_date'],
@@ -84,19 +827,8 @@ class Importer(object):
 
         organization_id = info['parent']
         if not organization_id:
-            self.logger.error('Cannot create post %s, it does not seem to have a parent organization' % info['name'])
+            self.report_error('Cannot create post %s, it does not seem to have a parent organization' % info['name'])
             return
 
-        try:
-            defaults['organization'] = Organization.objects.get(origin_id=organization_id)
-        except Organization.DoesNotExist:
-            self.logger.error('Cannot set org for %s, org with origin_id %s does not exist' %
-                              (info['name'], organization_id))
-
-        post, created = Post.objects.update_or_create(
-            data_source=self.data_source,
-            origin_id=info['origin_id'],
-            defaults=defaults,
-        )
-        verb = 'Created' if created else 'Updated'
-        self.logger.info('{} post {}'.format(verb, post))
+        values['organization'] = Ref(Organization, organization_id)
+        self.upsert(Post, info['origin_id'], values)
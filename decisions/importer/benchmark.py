@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data generators and a runner for benchmarking the importers.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import zipfile
+from collections import namedtuple, OrderedDict
+from datetime import date, timedelta
+
+import django
+from django.db import connection, connections
+
+Scale = namedtuple('Scale', (
+    'organizations',  # committees, each with an office holder and its own meetings
+    'meetings',  # per organization
+    'agenda_items',  # per meeting
+    'content_sections',  # per agenda item
+    'attachments',  # per agenda item
+    'geometries',  # in total, every case refers to up to two of them
+))
+
+DEFAULT_SCALE = Scale(organizations=10, meetings=20, agenda_items=10, content_sections=3, attachments=2, geometries=100)
+
+CITY_ID = '00001'
+FIRST_DATE = date(2015, 1, 1)
+WORDS = ('asemakaava', 'muutos', 'lausunto', 'hankinta', 'talousarvio', 'päätös', 'valtuustoaloite', 'koulu',
+         'katusuunnitelma', 'vuokraus', 'avustus', 'palvelu', 'toimitila', 'liikenne', 'puisto')
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for i in range(words)).capitalize()
+
+
+def _write_json_sections(fileobj, sections):
+    """
+    Write a JSON object of (key, items) sections without keeping all of the items in memory.
+    """
+    fileobj.write('{')
+    for i, (key, items) in enumerate(sections):
+        fileobj.write('%s\n%s: [' % (',' if i else '', json.dumps(key)))
+        for j, item in enumerate(items):
+            fileobj.write('%s\n  %s' % (',' if j else '', json.dumps(item, ensure_ascii=False)))
+        fileobj.write('\n]')
+    fileobj.write('\n}\n')
+
+
+def _helsinki_organization(org_id, org_type, name, parent):
+    return {
+        'id': org_id,
+        'type': org_type,
+        'name_fin': name,
+        'name_swe': None,
+        'shortname': name.split()[0],
+        'start_time': '2010-01-01T00:00:00',
+        'end_time': None,
+        'visitaddress_street': None,
+        'visitaddress_zip': None,
+        'modified_time': '2017-01-01T00:00:00',
+        'parents': [parent] if parent else [],
+        'people': [],
+    }
+
+
+def generate_helsinki_organizations(path, scale=DEFAULT_SCALE):
+    """
+    Write an organization file for the Helsinki importer with the organizations the Open Ahjo dump refers to.
+    """
+    organizations = [_helsinki_organization(CITY_ID, 13, 'Helsingin kaupunki', None)]
+    for i in range(scale.organizations):
+        committee_id = '%05d' % (i + 100)
+        organizations.append(_helsinki_organization(committee_id, 5, 'Lautakunta %d' % i, CITY_ID))
+        organizations.append(_helsinki_organization('%s01' % committee_id, 12, 'Viranhaltija %d' % i, committee_id))
+
+    with open(path, 'w', encoding='utf-8') as org_file:
+        json.dump(organizations, org_file, ensure_ascii=False)
+
+
+def generate_open_ahjo(path, scale=DEFAULT_SCALE, seed=0):
+    """
+    Write an Open Ahjo dump referring to the organizations of `generate_helsinki_organizations`.
+    """
+    rng = random.Random(seed)
+    policymakers = []
+    for i in range(scale.organizations):
+        committee_id = '%05d' % (i + 100)
+        policymakers.append((len(policymakers) + 1, committee_id, 'committee'))
+        policymakers.append((len(policymakers) + 1, '%s01' % committee_id, 'office_holder'))
+
+    meetings = [(policymaker_id * 10000 + i, policymaker_id)
+                for policymaker_id, origin_id, org_type in policymakers for i in range(scale.meetings)]
+    agenda_items = [('%d-%d' % (meeting_id, i), meeting_id, i) for meeting_id, policymaker_id in meetings
+                    for i in range(scale.agenda_items)]
+    functions = ['f%d' % i for i in range(max(len(agenda_items) // 50, 1))]
+
+    def issues():
+        for i in range(0, len(agenda_items), 2):
+            geometries = rng.sample(range(scale.geometries), min(scale.geometries, rng.randint(0, 2)))
+            yield {
+                'id': 'i%d' % i,
+                'subject': _text(rng, 6),
+                'register_id': 'HEL 2017-%06d' % i,
+                'category': rng.choice(functions),
+                'geometries': ['g%d' % geometry for geometry in geometries],
+            }
+
+    def items():
+        # every issue is handled by two consecutive agenda items
+        for n, (item_id, meeting_id, index) in enumerate(agenda_items):
+            yield {
+                'id': item_id,
+                'meeting': meeting_id,
+                'subject': _text(rng, 6),
+                'index': index + 1,
+                'resolution': rng.choice(('PASSED', 'TABLED', None)),
+                'issue': 'i%d' % (n - n % 2) if rng.random() < 0.9 else None,
+            }
+
+    def content_sections():
+        for item_id, meeting_id, index in agenda_items:
+            for i in range(scale.content_sections):
+                yield {
+                    'id': '%s-s%d' % (item_id, i),
+                    'agenda_item': item_id,
+                    'type': rng.choice(('draft resolution', 'summary', 'presenter')),
+                    'index': i,
+                    'text': '<p>%s</p>' % _text(rng, 200),
+                }
+
+    def attachments():
+        for item_id, meeting_id, index in agenda_items:
+            for i in range(scale.attachments):
+                public = rng.random() < 0.8
+                yield {
+                    'id': '%s-a%d' % (item_id, i),
+                    'agenda_item': item_id,
+                    'name': _text(rng, 3) if public else None,
+                    'url': '/attachments/%s-%d.pdf' % (item_id, i) if public else None,
+                    'number': i + 1,
+                    'public': public,
+                    'confidentiality_reason': None if public else 'JulkL 24 §',
+                }
+
+    sections = [
+        ('organizations', [{'origin_id': origin_id, 'type': org_type}
+                           for policymaker_id, origin_id, org_type in policymakers]),
+        ('policymakers', [{'id': policymaker_id, 'origin_id': origin_id}
+                          for policymaker_id, origin_id, org_type in policymakers]),
+        ('meetings', [{'id': meeting_id, 'policymaker': policymaker_id,
+                       'date': (FIRST_DATE + timedelta(days=meeting_id % 1000)).isoformat()}
+                      for meeting_id, policymaker_id in meetings]),
+        ('categories', [{'id': function_id, 'origin_id': '00 %s' % function_id[1:], 'name': _text(rng, 2),
+                         'parent': None} for function_id in functions]),
+        ('issue_geometries', [{'id': 'g%d' % i, 'name': 'Osoite %d' % i, 'type': 'address',
+                               'geometry': json.dumps({'type': 'Point', 'coordinates': [
+                                   24.9 + rng.random() / 10, 60.15 + rng.random() / 10]})}
+                              for i in range(scale.geometries)]),
+        ('issues', issues()),
+        ('agenda_items', items()),
+        ('content_sections', content_sections()),
+        ('attachments', attachments()),
+    ]
+    with open(path, 'w', encoding='utf-8') as data_file:
+        _write_json_sections(data_file, sections)
+
+
+def generate_scraper_archive(path, scale=DEFAULT_SCALE, seed=0):
+    """
+    Write a Paatos scraper archive. Geometries are not part of the scraper format.
+    """
+    rng = random.Random(seed)
+
+    def write(archive, member, data):
+        archive.writestr(member, json.dumps(data, ensure_ascii=False))
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(scale.organizations):
+            org_id = 'org%d' % i
+            org_path = 'organizations/%s' % org_id
+            write(archive, org_path + '/index.json', {
+                'sourceId': org_id, 'classification': 'lautakunta', 'name': 'Lautakunta %d' % i,
+                'founding_date': None, 'dissolution_date': None, 'parent': None,
+            })
+
+            cases = ['%s-c%d' % (org_id, j) for j in range(max(scale.meetings * scale.agenda_items // 2, 1))]
+            write(archive, org_path + '/cases.json', [
+                {'sourceId': case_id, 'title': _text(rng, 6), 'registerId': 'REG %s' % case_id,
+                 'functionId': '%02d' % rng.randint(0, 20)}
+                for case_id in cases
+            ])
+
+            for j in range(scale.meetings):
+                event_id = '%s-e%d' % (org_id, j)
+                event_path = '%s/events/%s' % (org_path, event_id)
+                event_date = (FIRST_DATE + timedelta(days=j)).isoformat()
+                write(archive, event_path + '/index.json', {
+                    'sourceId': event_id, 'startDate': event_date, 'endDate': event_date,
+                    'name': 'Kokous %d' % j,
+                })
+
+                for k in range(scale.agenda_items):
+                    action_id = '%s-a%d' % (event_id, k)
+                    action_path = '%s/actions/%s' % (event_path, action_id)
+                    write(archive, action_path + '/index.json', {
+                        'sourceId': action_id, 'title': _text(rng, 6), 'ordering': k + 1,
+                        'articleNumber': str(k + 1), 'eventId': event_id,
+                        'caseId': rng.choice(cases) if rng.random() < 0.9 else None,
+                    })
+                    write(archive, action_path + '/contents.json', [
+                        {'title': _text(rng, 3), 'content': '<p>%s</p>' % _text(rng, 200), 'order': n}
+                        for n in range(scale.content_sections)
+                    ])
+                    write(archive, action_path + '/attachments.json', [
+                        {'sourceId': '%s-t%d' % (action_id, n), 'name': _text(rng, 3),
+                         'url': 'http://example.com/%s-%d.pdf' % (action_id, n), 'number': n + 1,
+                         'public': True, 'confidentialityReason': None, 'actionId': action_id}
+                        for n in range(scale.attachments)
+                    ])
+
+
+def _import_helsinki(options, path):
+    from .helsinki import HelsinkiImporter
+    importer = HelsinkiImporter(dict(options, include_people=False))
+    importer.import_organizations(path)
+    return importer.stats
+
+
+def _import_open_ahjo(options, path, fast_load):
+    from .open_ahjo import OpenAhjoImporter
+    importer = OpenAhjoImporter(dict(options, filename=path, fast_load=fast_load))
+    importer.import_data()
+    return importer.stats
+
+
+def _import_scraper(options, path, workers):
+    from .paatos_scraper import PaatosScraperImporter
+    importer = PaatosScraperImporter('benchmark', {'name': 'Benchmark'}, dict(options, zipfile=path, workers=workers))
+    importer.import_data()
+    return importer.stats
+
+
+def _run_in_process(database_name, function, args, conn):
+    # A spawned process has to set up Django and point it at the benchmark database itself
+    django.setup()
+    connection.settings_dict['NAME'] = database_name
+    stats = function(*args)
+    total = stats.get_total()
+    conn.send(OrderedDict([
+        ('rows', total.rows_read),
+        ('written', total.rows_written),
+        ('seconds', total.wall_time),
+        ('queries', total.queries),
+        ('peak_rss', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+    ]))
+    conn.close()
+
+
+def run_import(name, function, *args):
+    """
+    Run an import in a child process, so that its peak memory use is measured on its own.
+
+    `function` is called with `args` and must return the ImportStats of the
+    import. It has to be defined at module level, so that the process can be
+    started with any multiprocessing start method.
+    """
+    # The child process must not share this process' database connection
+    connections.close_all()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_in_process,
+                                      args=(connection.settings_dict['NAME'], function, args, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        raise RuntimeError('Benchmark %s failed' % name)
+    finally:
+        process.join()
+
+    result['importer'] = name
+    result['rows_per_second'] = result['rows'] / result['seconds'] if result['seconds'] else 0
+    result['queries_per_row'] = result['queries'] / result['rows'] if result['rows'] else 0
+    return result
+
+
+def run_benchmarks(directory, scale=DEFAULT_SCALE, batch_size=None, workers=1, fast_load=False, seed=0):
+    """
+    Generate the synthetic data in directory and import it into a throwaway benchmark_<NAME> database.
+
+    The Open Ahjo dump is imported twice, the second time measures skipping
+    unchanged records. Returns a list of results per import.
+    """
+    helsinki_path = os.path.join(directory, 'helsinki.json')
+    open_ahjo_path = os.path.join(directory, 'open_ahjo.json')
+    scraper_path = os.path.join(directory, 'scraper.zip')
+    generate_helsinki_organizations(helsinki_path, scale)
+    generate_open_ahjo(open_ahjo_path, scale, seed)
+    generate_scraper_archive(scraper_path, scale, seed)
+
+    options = {'verbosity': 0, 'batch_size': batch_size, 'flush': False}
+    runs = (
+        ('helsinki', _import_helsinki, options, helsinki_path),
+        ('open_ahjo', _import_open_ahjo, options, open_ahjo_path, fast_load),
+        ('open_ahjo (unchanged)', _import_open_ahjo, options, open_ahjo_path, fast_load),
+        ('paatos_scraper', _import_scraper, options, scraper_path, workers),
+    )
+
+    logging.getLogger('decisions.importer').setLevel(logging.WARNING)
+    # The test database of the same settings would be dropped and replaced, so the benchmark has one of its own
+    test_settings = connection.settings_dict['TEST']
+    connection.settings_dict['TEST'] = dict(test_settings, NAME='benchmark_%s' % connection.settings_dict['NAME'])
+    try:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            return [run_import(*run) for run in runs]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        connection.settings_dict['TEST'] = test_settings
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import operator
+from functools import reduce
+
+from django.db import connection, models, transaction
+from django.db.models.deletion import get_candidate_relations_to_delete
+
+
+def get_cascade(root_models):
+    """
+    Return the root models and all models their deletion cascades to, in dependency order.
+
+    Returns (models, references) where every model comes after the models it
+    refers to and references maps each model to the (field, referred model)
+    pairs it is deleted through. References of a model to itself are not
+    followed, see get_self_references.
+    """
+    references = {model: [] for model in root_models}
+    queue = list(root_models)
+    while queue:
+        model = queue.pop(0)
+        for relation in get_candidate_relations_to_delete(model._meta):
+            related_model = relation.related_model
+            if relation.on_delete is models.DO_NOTHING or related_model is model:
+                continue
+            if relation.on_delete is not models.CASCADE:
+                raise ValueError('Cannot flush %s, deleting it does not cascade to %s' % (
+                    model.__name__, related_model.__name__))
+            if related_model not in references:
+                references[related_model] = []
+                queue.append(related_model)
+            references[related_model].append((relation.field, model))
+
+    ordered = []
+
+    def visit(model, path):
+        if model in ordered:
+            return
+        if model in path:
+            raise ValueError('Cannot flush %s, it is part of a reference cycle' % model.__name__)
+        for field, referred_model in references[model]:
+            visit(referred_model, path + [model])
+        ordered.append(model)
+
+    for model in references:
+        visit(model, [])
+    return ordered, references
+
+
+def get_self_references(model):
+    """
+    Return the fields of model referring to the model itself, which are cleared instead of cascading.
+    """
+    fields = []
+    for relation in get_candidate_relations_to_delete(model._meta):
+        if relation.related_model is not model or relation.on_delete is models.DO_NOTHING:
+            continue
+        if not relation.field.null:
+            raise ValueError('Cannot flush %s, %s cannot be cleared' % (model.__name__, relation.field.name))
+        fields.append(relation.field)
+    return fields
+
+
+def flush_data_source(data_source, root_models, logger):
+    """
+    Delete the objects of root_models imported from data_source and everything cascading from them.
+
+    Every table is emptied with a single set-based statement, starting from
+    the ones referring to the others. If the tables contain no objects of
+    other data sources they are truncated instead. Objects of other data
+    sources that are kept lose their references to deleted objects of their
+    own model, e.g. their parent.
+    """
+    ordered, references = get_cascade(root_models)
+    quote = connection.ops.quote_name
+    tables = [model._meta.db_table for model in ordered]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        others = [model for model in ordered if hasattr(model, 'data_source') and
+                  model._default_manager.exclude(data_source=data_source).exists()]
+        if not others:
+            logger.info('Truncating %s...' % ', '.join(tables))
+            cursor.execute('TRUNCATE %s' % ', '.join(quote(table) for table in tables))
+            return
+
+        querysets = {}
+        for model in ordered:
+            conditions = [models.Q(data_source=data_source)] if model in root_models else []
+            for field, referred_model in references[model]:
+                conditions.append(models.Q(**{'%s__in' % field.name: querysets[referred_model].values('pk')}))
+            querysets[model] = model._default_manager.filter(reduce(operator.or_, conditions))
+
+        for model in ordered:
+            deleted = querysets[model].values('pk')
+            for field in get_self_references(model):
+                count = model._default_manager.filter(**{'%s__in' % field.name: deleted}).exclude(
+                    pk__in=deleted).update(**{field.name: None})
+                if count:
+                    logger.info('%s: %d %s cleared' % (model._meta.db_table, count, field.name))
+
+        for model in reversed(ordered):
+            sql, params = querysets[model].values('pk').query.sql_with_params()
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+                quote(model._meta.db_table), quote(model._meta.pk.column), sql), params)
+            if cursor.rowcount:
+                logger.info('%s: %d deleted' % (model._meta.db_table, cursor.rowcount))
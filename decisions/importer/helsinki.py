@@ -2,13 +2,13 @@
 # Based heavily on https://github.com/City-of-Helsinki/openahjo/blob/4bcb003d5db932ca28ea6851d76a20a4ee6eef54/decisions/importer/helsinki.py  # noqa
 
 import json
+from collections import defaultdict, OrderedDict
 
 from enum import Enum
 from dateutil.parser import parse as dateutil_parse
-from django.db import transaction
 from django.utils.text import slugify
 
-from decisions.models import DataSource, Person, OrganizationClass
+from decisions.models import DataSource, Organization, OrganizationClass, Person, Post
 
 from .base import Importer
 
@@ -78,11 +78,10 @@ class HelsinkiImporter(Importer):
         if created:
             self.logger.debug('Created new data source "helsinki"')
 
-    @transaction.atomic()
     def _import_organization(self, info):
         org_type = Org(info['type'])
         org = dict(origin_id=info['id'])
-        org['classification'] = OrganizationClass.objects.get(id=org_type.value)
+        org['classification'] = org_type.value
 
         if org_type in [Org.INTRODUCER, Org.INTRODUCER_FIELD, Org.PACKAGED_INTRODUCER_SERVICE]:
             self.skip_orgs.add(org['origin_id'])
@@ -174,43 +173,86 @@ class HelsinkiImporter(Importer):
 
     def import_organizations(self, filename):
         self.logger.info('Updating organization class definitions...')
-        for enum, names in NAME_MAP.items():
-            values = {
-                'id': enum.value,
-                'name': names[0]
-            }
-            klass, updated = OrganizationClass.objects.update_or_create(id=values['id'], defaults=values)
+        with self.stage('classes'):
+            for enum, names in NAME_MAP.items():
+                values = {
+                    'id': enum.value,
+                    'name': names[0]
+                }
+                klass, updated = OrganizationClass.objects.update_or_create(id=values['id'], defaults=values)
 
         self.logger.info('Importing organizations...')
 
-        with open(filename, 'r') as org_file:
-            org_list = json.load(org_file)
-
-        if not self.options['include_people']:
-            Person.objects.all().delete()
-
-        self.skip_orgs = set()
-
-        self.org_dict = {org['id']: org for org in org_list}
-        ordered = []
-        # Start import from the root orgs, move down level by level.
-        while len(ordered) != len(org_list):
-            for org in org_list:
-                if 'added' in org:
-                    continue
-                if not org['parents']:
-                    org['added'] = True
-                    ordered.append(org)
-                    continue
-                for p in org['parents']:
-                    if 'added' not in self.org_dict[p]:
-                        break
-                else:
-                    org['added'] = True
-                    ordered.append(org)
+        with self.stage('read'):
+            with open(filename, 'r') as org_file:
+                org_list = json.load(org_file)
+
+            if not self.options['include_people'] and not self.validation:
+                Person.objects.all().delete()
+
+            self.skip_orgs = set()
 
-        for i, org in enumerate(ordered):
-            self.logger.info('Processing organization {} / {}'.format(i + 1, len(ordered)))
-            self._import_organization(org)
+            levels = self._order_organizations(org_list)
+
+        with self.stage('organizations'):
+            for i, level in enumerate(levels):
+                self.logger.info('Processing level {} / {} ({} organizations)'.format(i + 1, len(levels), len(level)))
+                self.run_in_batches(level, self._import_organization)
+
+            self.finish_upserts(Organization)
+            self.finish_upserts(Post)
+            self.rebuild_hierarchies(Organization)
 
         self.logger.info('Import done!')
+
+    def _get_parent_ids(self, info):
+        parent_ids = list(info['parents'] or [])
+        if info['name_fin'] in PARENT_OVERRIDES:
+            parent_ids.append(PARENT_OVERRIDES[info['name_fin']])
+        return parent_ids
+
+    def _order_organizations(self, org_list):
+        """
+        Group organizations into levels so that every parent is in an earlier level than its children.
+
+        Missing parents and parent cycles are reported before anything is
+        written. Organizations with missing parents are imported without
+        them, organizations in or below a cycle are not imported.
+        """
+        org_dict = OrderedDict()
+        for org in org_list:
+            if org['id'] in org_dict:
+                self.logger.warning('Org %s is listed more than once, using the last one' % org['id'])
+            org_dict[org['id']] = org
+
+        children = defaultdict(list)
+        parent_counts = OrderedDict()
+        for org_id, org in org_dict.items():
+            parent_ids = set()
+            for parent_id in self._get_parent_ids(org):
+                if parent_id in org_dict:
+                    parent_ids.add(parent_id)
+                else:
+                    self.logger.error('Parent %s of org %s (%s) does not exist' % (parent_id, org_id, org['name_fin']))
+            parent_counts[org_id] = len(parent_ids)
+            for parent_id in parent_ids:
+                children[parent_id].append(org_id)
+
+        levels = []
+        level = [org_id for org_id, count in parent_counts.items() if count == 0]
+        while level:
+            levels.append([org_dict[org_id] for org_id in level])
+            next_level = []
+            for org_id in level:
+                for child_id in children[org_id]:
+                    parent_counts[child_id] -= 1
+                    if parent_counts[child_id] == 0:
+                        next_level.append(child_id)
+            level = next_level
+
+        unordered = [org_id for org_id, count in parent_counts.items() if count > 0]
+        if unordered:
+            self.logger.error('Cannot import orgs %s, they are in or below a cycle of parents'
+                              % ', '.join(str(org_id) for org_id in unordered))
+
+        return levels
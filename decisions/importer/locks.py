@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import zlib
+from contextlib import contextmanager
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+# First key of the advisory locks of imports, the second one identifies the data source
+IMPORT_LOCK_NAMESPACE = 0x70616174
+
+
+class ImportLocked(Exception):
+    pass
+
+
+def get_lock_key(identifier):
+    """
+    Return a signed 32-bit advisory lock key for the data source with the given identifier.
+    """
+    key = zlib.crc32(identifier.encode('utf-8'))
+    return key - 2 ** 32 if key >= 2 ** 31 else key
+
+
+@contextmanager
+def data_source_lock(identifier):
+    """
+    Hold the advisory lock for importing the data source with the given identifier.
+
+    The lock is held by a connection of its own, so it is kept while the
+    importer closes and reopens its connections. Raises ImportLocked if
+    another import of the data source holds the lock.
+    """
+    connection = connections[DEFAULT_DB_ALIAS].copy()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [IMPORT_LOCK_NAMESPACE, get_lock_key(identifier)])
+            if not cursor.fetchone()[0]:
+                raise ImportLocked('Another import of %s is running' % identifier)
+        yield
+    finally:
+        # Closing the session releases the lock
+        connection.close()
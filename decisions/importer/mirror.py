@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import Counter, defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from decisions.models import Attachment, DataSource
+
+CHUNK_SIZE = 64 * 1024
+
+# Number of fetches per worker queued ahead of the one being saved
+PENDING_FETCHES_PER_WORKER = 4
+
+# Responses retried with backoff, besides connection errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+FetchJob = namedtuple('FetchJob', ('pk', 'data_source_id', 'url', 'fetched_url', 'file', 'content_hash', 'etag',
+                                   'last_modified'))
+
+# status is one of 'stored', 'unchanged', 'not modified' and 'failed'
+FetchResult = namedtuple('FetchResult', ('job', 'status', 'file', 'content_hash', 'etag', 'last_modified', 'error'))
+
+
+def get_extension(url):
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    return extension if 1 < len(extension) <= 8 and extension[1:].isalnum() else ''
+
+
+class ContentStore(object):
+    """
+    Stores files under the SHA-256 hash of their content, so identical files are only stored once.
+    """
+
+    def __init__(self, storage=None, prefix='attachments'):
+        self.storage = storage or default_storage
+        self.prefix = prefix
+        self.lock = threading.Lock()
+
+    def find(self, content_hash):
+        """
+        Return the name of the stored file with the given hash or None.
+        """
+        directory = '%s/%s' % (self.prefix, content_hash[:2])
+        if not self.storage.exists(directory):
+            return None
+        for name in self.storage.listdir(directory)[1]:
+            if name.split('.')[0] == content_hash:
+                return '%s/%s' % (directory, name)
+        return None
+
+    def save(self, file, content_hash, extension=''):
+        """
+        Store the content of file unless it is stored already and return its name in the storage.
+        """
+        with self.lock:
+            name = self.find(content_hash)
+            if name is None:
+                name = '%s/%s/%s%s' % (self.prefix, content_hash[:2], content_hash, extension)
+                name = self.storage.save(name, File(file, name=os.path.basename(name)))
+        return name
+
+
+class AttachmentFetcher(object):
+    """
+    Fetches the contents of attachments concurrently into a ContentStore.
+
+    All workers share a session, so connections are pooled and kept alive.
+    Failed requests are retried with backoff and no more than per_host
+    requests go to one host at a time. Contents fetched before are only
+    downloaded again if their ETag or Last-Modified has changed.
+    """
+
+    def __init__(self, store, workers=8, per_host=4, retries=3, timeout=30, logger=None):
+        self.store = store
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.host_semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self.host_lock = threading.Lock()
+
+    def _get_host_semaphore(self, url):
+        with self.host_lock:
+            return self.host_semaphores[urlsplit(url).netloc]
+
+    def fetch(self, job):
+        """
+        Fetch the content of one attachment into the store and return a FetchResult.
+
+        Runs in the worker threads, so it must not touch the database.
+        """
+        headers = {}
+        if job.file and job.fetched_url == job.url:
+            if job.etag:
+                headers['If-None-Match'] = job.etag
+            if job.last_modified:
+                headers['If-Modified-Since'] = job.last_modified
+
+        try:
+            with self._get_host_semaphore(job.url):
+                response = self.session.get(job.url, headers=headers, stream=True, timeout=self.timeout)
+                try:
+                    if response.status_code == 304:
+                        return FetchResult(job, 'not modified', job.file, job.content_hash, job.etag,
+                                           job.last_modified, None)
+                    response.raise_for_status()
+                    etag = response.headers.get('ETag', '')[:255]
+                    last_modified = response.headers.get('Last-Modified', '')[:64]
+
+                    with tempfile.TemporaryFile() as body:
+                        digest = hashlib.sha256()
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            digest.update(chunk)
+                            body.write(chunk)
+                        content_hash = digest.hexdigest()
+                        if job.file and content_hash == job.content_hash:
+                            return FetchResult(job, 'unchanged', job.file, content_hash, etag, last_modified, None)
+                        body.seek(0)
+                        name = self.store.save(body, content_hash, get_extension(job.url))
+                    return FetchResult(job, 'stored', name, content_hash, etag, last_modified, None)
+                finally:
+                    response.close()
+        except (requests.RequestException, OSError) as e:
+            return FetchResult(job, 'failed', None, None, None, None, str(e))
+
+    def mirror(self, queryset):
+        """
+        Fetch the attachments of queryset and save the results as they come in.
+
+        Returns a Counter of the results by status.
+        """
+        counts = Counter()
+        # pks of the data sources of the attachments stored
+        changed = set()
+        values = queryset.exclude(url='').order_by('pk').values_list(*FetchJob._fields)
+        jobs = (FetchJob(*job) for job in values.iterator())
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for job in jobs:
+                pending.append(executor.submit(self.fetch, job))
+                if len(pending) >= self.workers * PENDING_FETCHES_PER_WORKER:
+                    self._save_result(pending.popleft().result(), counts, changed)
+            while pending:
+                self._save_result(pending.popleft().result(), counts, changed)
+
+        # The API serves the new files once it knows the data has changed
+        DataSource.bump_generations(changed)
+
+        summary = ', '.join('%d %s' % (count, status) for status, count in sorted(counts.items()))
+        self.logger.info('Attachments: %s' % (summary or 'nothing to fetch'))
+        return counts
+
+    def _save_result(self, result, counts, changed):
+        counts[result.status] += 1
+        job = result.job
+        if result.status == 'failed':
+            self.logger.warning('Cannot fetch attachment %d from %s: %s' % (job.pk, job.url, result.error))
+            return
+
+        now = timezone.now()
+        values = dict(fetched_at=now, fetched_url=job.url, etag=result.etag, last_modified=result.last_modified)
+        if result.status == 'stored':
+            self.logger.debug('Stored attachment %d from %s as %s' % (job.pk, job.url, result.file))
+            values.update(file=result.file, content_hash=result.content_hash, modified_at=now)
+            changed.add(job.data_source_id)
+        Attachment.objects.filter(pk=job.pk).update(**values)
@@ -7,7 +7,16 @@ from decisions.models import (
     Action, Attachment, Case, CaseGeometry, Content, DataSource, Event, Function, Organization, Post
 )
 
-from .base import Importer
+from .base import Importer, Ref
+from .staging import StagingUpserter
+from .streaming import JSONSectionReader
+
+# Sections kept in memory when streaming, the rest are read one record at a time
+RESIDENT_SECTIONS = ('organizations', 'policymakers', 'meetings')
+
+# The largest models, loaded through staging tables with --fast-load, and their stages
+FAST_LOAD_MODELS = (Action, Content, Attachment)
+FAST_LOAD_STAGES = ('actions', 'contents', 'attachments')
 
 
 class OpenAhjoImporter(Importer):
@@ -20,236 +29,205 @@ class OpenAhjoImporter(Importer):
         if created:
             self.logger.debug('Created new data source "open_ahjo"')
         self.meeting_to_org = None
+        self.attachment_url_base = getattr(settings, 'OPEN_AHJO_ATTACHMENT_URL_BASE', None)
+
+    def get_origin_id_queryset(self, model):
+        # Organizations and posts are imported from the Helsinki organization data
+        if model in (Organization, Post):
+            return model.objects.all()
+        return super().get_origin_id_queryset(model)
+
+    def get_upserter(self, model):
+        if self.options.get('fast_load') and not self.validation and model in FAST_LOAD_MODELS and \
+                model not in self.upserters:
+            self.upserters[model] = StagingUpserter(
+                model, self.data_source, self.get_origin_id_queryset, self.forget_origin_id_map, self.logger,
+                batch_size=self.batch_size,
+            )
+        return super().get_upserter(model)
+
+    def get_committed_position(self):
+        # Staged rows are only merged at the end of the stage, so the stage is started over
+        if self.options.get('fast_load') and self.checkpoint is not None and \
+                self.checkpoint.stage in FAST_LOAD_STAGES:
+            return 0
+        return super().get_committed_position()
+
+    def _import_function(self, function_data):
+        values = dict(
+            name=function_data['name'],
+            function_id=function_data['origin_id'],
+        )
+
+        parent_id = function_data['parent']
+        if parent_id:
+            values['parent'] = Ref(Function, parent_id)
+
+        self.upsert(Function, function_data['id'], values)
 
     def _import_functions(self, data):
         self.logger.info('Importing functions...')
+        self.run_in_batches(data['categories'], self._import_function)
+        self.finish_upserts(Function)
+        self.rebuild_hierarchies(Function)
+
+    def _import_event(self, meeting_data):
+        values = dict(
+            start_date=meeting_data['date'],
+            end_date=meeting_data['date'],
+        )
 
-        for function_data in data['categories']:
-            defaults = dict(
-                name=function_data['name'],
-                function_id=function_data['origin_id'],
-            )
-
-            parent_id = function_data['parent']
-            if parent_id:
-                try:
-                    defaults['parent'] = Function.objects.get(origin_id=parent_id)
-                except Function.DoesNotExist:
-                    self.logger('Function parent %s does not exist' % parent_id)
-                    continue
-
-            function, created = Function.objects.update_or_create(
-                origin_id=function_data['id'],
-                data_source=self.data_source,
-                defaults=defaults
-            )
+        organization_data = self.meeting_to_org.get(meeting_data['id'])
+        if organization_data:
+            if organization_data['type'] == 'office_holder':
+                return
+            values['organization'] = Ref(Organization, organization_data['origin_id'])
 
-            if created:
-                self.logger.info('Created function %s' % function)
+        self.upsert(Event, meeting_data['id'], values)
 
     def _import_events(self, data):
         self.logger.info('Importing events...')
+        self.run_in_batches(data['meetings'], self._import_event)
+        self.finish_upserts(Event)
+
+    def _import_case_geometry(self, geometry_data):
+        values = dict(
+            name=geometry_data['name'],
+            type=geometry_data['type'],
+            geometry=geometry_data['geometry'],
+        )
 
-        for meeting_data in data['meetings']:
-            defaults = dict(
-                start_date=meeting_data['date'],
-                end_date=meeting_data['date'],
-            )
-
-            organization_data = self.meeting_to_org.get(meeting_data['id'])
-            if organization_data:
-                if organization_data['type'] == 'office_holder':
-                    continue
-                try:
-                    organization = Organization.objects.get(origin_id=organization_data['origin_id'])
-                    defaults['organization'] = organization
-                except Organization.DoesNotExist:
-                    self.logger.error('Organization %s does not exist' % organization_data['origin_id'])
-                    continue
-
-            event, created = Event.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=meeting_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created event %s' % event)
+        self.upsert(CaseGeometry, geometry_data['id'], values)
 
     def _import_case_geometries(self, data):
         self.logger.info('Importing case geometries...')
+        self.run_in_batches(data['issue_geometries'], self._import_case_geometry)
+        self.finish_upserts(CaseGeometry)
+
+    def _import_case(self, issue_data):
+        values = dict(
+            title=issue_data['subject'],
+            register_id=issue_data['register_id'],
+            function=Ref(Function, issue_data['category']),
+        )
 
-        for geometry_data in data['issue_geometries']:
-            defaults = dict(
-                name=geometry_data['name'],
-                type=geometry_data['type'],
-                geometry=geometry_data['geometry'],
-            )
-
-            case_geometry, created = CaseGeometry.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=geometry_data['id'],
-                defaults=defaults,
-            )
-
-            if created:
-                self.logger.info('Created case geometry %s' % case_geometry)
+        self.upsert(Case, issue_data['id'], values)
+        self.set_m2m(Case, 'geometries', issue_data['id'], issue_data['geometries'])
 
     def _import_cases(self, data):
         self.logger.info('Importing cases...')
+        self.run_in_batches(data['issues'], self._import_case)
+        self.finish_upserts(Case)
+
+    def _import_action(self, agenda_item_data):
+        org = self.meeting_to_org.get(agenda_item_data['meeting'])
+        if not org:
+            self.report_error('Cannot find matching org for meeting %s' % agenda_item_data['meeting'])
+            return
+
+        values = dict(
+            title=agenda_item_data['subject'],
+            ordering=agenda_item_data['index'],
+            resolution=agenda_item_data['resolution'] or '',
+            case=None,
+            post=None,
+            event=None,
+        )
+        if agenda_item_data['issue']:
+            values['case'] = Ref(Case, agenda_item_data['issue'])
+        if org['type'] == 'office_holder':
+            values['post'] = Ref(Post, org['origin_id'])
+        else:
+            values['event'] = Ref(Event, agenda_item_data['meeting'])
 
-        for issue_data in data['issues']:
-            defaults = dict(
-                title=issue_data['subject'],
-                register_id=issue_data['register_id'],
-            )
-
-            try:
-                defaults['function'] = Function.objects.get(origin_id=issue_data['category'])
-            except Function.DoesNotExist:
-                self.logger.error('Function %s does not exist' % issue_data['category'])
-                continue
-
-            case, created = Case.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=issue_data['id'],
-                defaults=defaults,
-            )
-
-            if created:
-                self.logger.info('Created case %s' % case)
-
-            case.geometries = CaseGeometry.objects.filter(origin_id__in=issue_data['geometries'])
+        self.upsert(Action, agenda_item_data['id'], values)
 
     def _import_actions(self, data):
         self.logger.info('Importing actions...')
+        self.run_in_batches(data['agenda_items'], self._import_action)
+        self.finish_upserts(Action)
+
+    def _import_content(self, content_section_data):
+        values = dict(
+            hypertext=content_section_data['text'],
+            type=content_section_data['type'],
+            ordering=content_section_data['index'],
+            action=Ref(Action, content_section_data.get('agenda_item')),
+        )
 
-        for agenda_item_data in data['agenda_items']:
-            org = self.meeting_to_org.get(agenda_item_data['meeting'])
-            if not org:
-                self.logger.error('Cannot find matching org for meeting %s' % agenda_item_data['meeting'])
-                continue
-
-            defaults = dict(
-                title=agenda_item_data['subject'],
-                ordering=agenda_item_data['index'],
-                resolution=agenda_item_data['resolution'] or '',
-            )
-            if agenda_item_data['issue']:
-                try:
-                    case = Case.objects.get(origin_id=agenda_item_data['issue'])
-                    defaults['case'] = case
-                except Case.DoesNotExist:
-                    self.logger.error('Case %s does not exist' % agenda_item_data['issue'])
-                    continue
-            if org['type'] == 'office_holder':
-                try:
-                    post = Post.objects.get(origin_id=org['origin_id'])
-                    defaults['post'] = post
-                except Post.DoesNotExist:
-                    self.logger.error('Post %s does not exist' % org['origin_id'])
-                    continue
-            else:
-                try:
-                    event = Event.objects.get(origin_id=agenda_item_data['meeting'])
-                    defaults['event'] = event
-                except Event.DoesNotExist:
-                    self.logger.error('Event %s does not exist' % agenda_item_data['meeting'])
-                    continue
-
-            action, created = Action.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=agenda_item_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created action %s' % action)
+        self.upsert(Content, content_section_data['id'], values)
 
     def _import_contents(self, data):
         self.logger.info('Importing contents...')
+        self.run_in_batches(data['content_sections'], self._import_content)
+        self.finish_upserts(Content)
+
+    def _import_attachment(self, attachment_data):
+        url = ''
+        if attachment_data['url'] and self.attachment_url_base:
+            url = self.attachment_url_base + attachment_data['url']
+
+        values = dict(
+            name=attachment_data['name'] or '',
+            url=url,
+            number=attachment_data['number'],
+            public=attachment_data['public'],
+            confidentiality_reason=attachment_data['confidentiality_reason'] or '',
+            action=Ref(Action, attachment_data.get('agenda_item')),
+        )
 
-        for content_section_data in data['content_sections']:
-            defaults = dict(
-                hypertext=content_section_data['text'],
-                type=content_section_data['type'],
-                ordering=content_section_data['index'],
-            )
-
-            action_id = content_section_data.get('agenda_item')
-            try:
-                action = Action.objects.get(origin_id=action_id)
-                defaults['action'] = action
-            except Action.DoesNotExist:
-                self.logger.error('Action %s does not exist' % action_id)
-                continue
-
-            content, created = Content.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=content_section_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created content %s' % content)
+        self.upsert(Attachment, attachment_data['id'], values)
 
     def _import_attachments(self, data):
         self.logger.info('Importing attachments...')
+        self.run_in_batches(data['attachments'], self._import_attachment)
+        self.finish_upserts(Attachment)
 
-        url_base = getattr(settings, 'OPEN_AHJO_ATTACHMENT_URL_BASE', None)
-
-        for attachment_data in data['attachments']:
-            defaults = dict(
-                name=attachment_data['name'] or '',
-                url=url_base + attachment_data['url'] if attachment_data['url'] and url_base else '',
-                number=attachment_data['number'],
-                public=attachment_data['public'],
-                confidentiality_reason=attachment_data['confidentiality_reason'] or '',
-            )
+    def _map_meetings_to_organizations(self, data):
+        org_dict = {o['origin_id']: o for o in data['organizations']}
 
-            action_id = attachment_data.get('agenda_item')
-            try:
-                action = Action.objects.get(origin_id=action_id)
-                defaults['action'] = action
-            except Action.DoesNotExist:
-                self.logger.error('Action %s does not exist' % action_id)
-                continue
-
-            attachment, created = Attachment.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=attachment_data['id'],
-                defaults=defaults
-            )
+        policymaker_to_org = {}
+        for policymaker in data['policymakers']:
+            if policymaker['origin_id'] in org_dict:
+                policymaker_to_org[policymaker['id']] = org_dict[policymaker['origin_id']]
+            else:
+                self.report_error('Cannot find org %s of policymaker %s' % (policymaker['origin_id'],
+                                                                            policymaker['id']))
 
-            if created:
-                self.logger.info('Created attachment %s' % attachment)
+        self.meeting_to_org = {}
+        for meeting in data['meetings']:
+            if meeting['policymaker'] in policymaker_to_org:
+                self.meeting_to_org[meeting['id']] = policymaker_to_org[meeting['policymaker']]
+            else:
+                self.report_error('Cannot find policymaker %s of meeting %s' % (meeting['policymaker'],
+                                                                                meeting['id']))
 
     def import_data(self):
         self.logger.info('Importing open ahjo data...')
 
-        with open(self.options['filename'], 'r') as data_file:
-            data = json.load(data_file)
+        with self.stage('read'):
+            if self.options.get('stream'):
+                data = JSONSectionReader(self.options['filename'], resident=RESIDENT_SECTIONS)
+            else:
+                with open(self.options['filename'], 'r') as data_file:
+                    data = json.load(data_file)
+
+            self._map_meetings_to_organizations(data)
 
-        # pre calc meeting to org mapping
-        org_dict = {o['origin_id']: o for o in data['organizations']}
-        policymaker_to_org = {p['id']: org_dict[p['origin_id']] for p in data['policymakers']}
-        self.meeting_to_org = {m['id']: policymaker_to_org[m['policymaker']] for m in data['meetings']}
+        self.start_checkpoint(self.options['filename'])
 
         if self.options['flush']:
             self.logger.info('Deleting all objects first...')
-            Function.objects.all().delete()
-            Event.objects.all().delete()
-            CaseGeometry.objects.all().delete()
-            Action.objects.all().delete()
-            Content.objects.all().delete()
-            Attachment.objects.all().delete()
-
-        self._import_functions(data)
-        self._import_events(data)
-        self._import_case_geometries(data)
-        self._import_cases(data)
-        self._import_actions(data)
-        self._import_contents(data)
-        self._import_attachments(data)
-
+            self.run_stage('flush', self.flush_data, Function, Event, CaseGeometry, Action, Content, Attachment)
+
+        self.run_stage('functions', self._import_functions, data)
+        self.run_stage('events', self._import_events, data)
+        self.run_stage('case geometries', self._import_case_geometries, data)
+        self.run_stage('cases', self._import_cases, data)
+        self.run_stage('actions', self._import_actions, data)
+        self.run_stage('contents', self._import_contents, data)
+        self.run_stage('attachments', self._import_attachments, data)
+        self.run_stage('search', self.refresh_search_vectors)
+
+        self.finish_checkpoint()
         self.logger.info('Import done!')
@@ -1,30 +1,76 @@
 # -*- coding: utf-8 -*-
-import json
-import os
-import os.path
-import tempfile
-import zipfile
+import logging
+import multiprocessing
+from collections import deque
+
 import dateutil.parser
+from django.db import connections, transaction
 from django.utils.text import slugify
 
 from decisions.models import (
-    Action, Attachment, Case, Content, DataSource, Event, Organization, Function, CaseGeometry
+    Action, Attachment, Case, Content, DataSource, Event, ImportManifest, Organization, OrganizationClass, Function,
+    CaseGeometry
 )
 
-from .base import Importer
-
-
-class PaatosScraperImporter(Importer):
-    def __init__(self, identifier, defaults, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.data_source, created = DataSource.objects.get_or_create(
-            identifier=identifier,
-            defaults=defaults
-        )
-        if created:
-            self.logger.debug('Created new data source "%s"' % identifier)
-
-    def _import_organization(self, data):
+from .archive import ZipArchive
+from .base import Importer, INVALID_RECORD_ERRORS, Ref
+from .stats import timed
+
+# Number of parsed units per worker allowed to wait for the writer
+PENDING_UNITS_PER_WORKER = 8
+
+
+class PaatosScraperParser(object):
+    """
+    Decodes and normalises the files of a Paatos scraper archive.
+
+    The archive is handled in units, which are either an organization
+    (its index and cases) or a single event of an organization (the event
+    with its actions, contents and attachments). Parsing a unit returns a
+    list of (model, origin_id, values) records ready to be written. The
+    parser never touches the database, so units can be parsed in worker
+    processes. The time spent in each _handle_* method, without the
+    _handle_* methods it calls, is added up in `timings`.
+    """
+
+    def __init__(self, archive, logger):
+        self.archive = archive
+        self.logger = logger
+        self.timings = {}
+
+    def iter_units(self):
+        for organization_source_id in self.archive.listdir('organizations'):
+            yield (organization_source_id, None)
+            events_path = 'organizations/%s/events' % organization_source_id
+            if self.archive.exists(events_path):
+                for event_source_id in self.archive.listdir(events_path):
+                    yield (organization_source_id, event_source_id)
+
+    @staticmethod
+    def unit_of(path):
+        """
+        Return the unit the archive member with the given path belongs to, or None.
+        """
+        parts = path.split('/')
+        if len(parts) < 3 or parts[0] != 'organizations':
+            return None
+        if parts[2] == 'events':
+            return (parts[1], parts[3]) if len(parts) > 4 else None
+        return (parts[1], None)
+
+    def parse_unit(self, unit):
+        organization_source_id, event_source_id = unit
+        current_path = 'organizations/' + organization_source_id
+        records = []
+        if event_source_id is None:
+            self._handle_organization(records, current_path + '/index.json')
+            self._handle_organization_cases(records, current_path + '/cases.json')
+        else:
+            self._handle_organization_event(records, current_path + '/events', organization_source_id,
+                                            event_source_id)
+        return records
+
+    def _parse_organization(self, data):
         classification = data['classification'].title()
         org = dict(origin_id=data['sourceId'])
         org['classification'] = classification
@@ -37,110 +83,41 @@ class PaatosScraperImporter(Importer):
 
         org['parent'] = data['parent']
 
-        self.save_organization(org)
-
-    def _import_function(self, name, source_id):
-        self.logger.info('Importing functions...')
-
-        defaults = dict(
-            name=name,
-            function_id=source_id
-        )
-
-        function, created = Function.objects.update_or_create(
-            origin_id=source_id,
-            data_source=self.data_source,
-            defaults=defaults
-        )
-
-        if created:
-            self.logger.info('Created function %s' % function)
+        return Organization, org['origin_id'], org
 
-        return function
-
-    def _import_event(self, data, organization_source_id):
-        self.logger.info('Importing event...')
-
-        defaults = dict(
+    def _parse_event(self, data, organization_source_id):
+        values = dict(
             start_date=dateutil.parser.parse(data['startDate']).date(),
             end_date=dateutil.parser.parse(data['endDate']).date(),
-            name=data['name']
-        )
-
-        try:
-            organization = Organization.objects.get(origin_id=organization_source_id)
-            defaults['organization'] = organization
-        except Organization.DoesNotExist:
-            self.logger.error('Organization %s does not exist' % organization_source_id)
-            return
-
-        event, created = Event.objects.update_or_create(
-            data_source=self.data_source,
-            origin_id=data['sourceId'],
-            defaults=defaults
+            name=data['name'],
+            organization=Ref(Organization, organization_source_id),
         )
 
-        if created:
-            self.logger.info('Created event %s' % event)
-
-    def _import_cases(self, data):
-        self.logger.info('Importing case...')
+        return Event, data['sourceId'], values
 
+    def _parse_cases(self, data):
         for case_data in data:
-
-            defaults = dict(
+            values = dict(
                 title=case_data['title'],
                 register_id=case_data['registerId'],
+                function=Ref(Function, case_data['functionId']),
             )
 
-            try:
-                defaults['function'] = Function.objects.get(origin_id=case_data['functionId'])
-            except Function.DoesNotExist:
-                defaults['function'] = self._import_function(case_data['functionId'], case_data['functionId'])
-
-            case, created = Case.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=case_data['sourceId'],
-                defaults=defaults,
-            )
-
-            if created:
-                self.logger.info('Created case %s' % case)
-
-    def _import_action(self, data):
-        self.logger.info('Importing action...')
+            yield Case, case_data['sourceId'], values
 
-        defaults = dict(
+    def _parse_action(self, data):
+        values = dict(
             title=data['title'],
             ordering=data['ordering'],
-            article_number=data['articleNumber']
+            article_number=data['articleNumber'],
+            event=Ref(Event, data['eventId']),
         )
         if data['caseId']:
-            try:
-                case = Case.objects.get(origin_id=data['caseId'])
-                defaults['case'] = case
-            except Case.DoesNotExist:
-                self.logger.error('Case %s does not exist' % data['caseId'])
-                return
-        try:
-            event = Event.objects.get(origin_id=data['eventId'])
-            defaults['event'] = event
-        except Event.DoesNotExist:
-            self.logger.error('Event %s does not exist' % data['eventId'])
-            return
-
-        action, created = Action.objects.update_or_create(
-            data_source=self.data_source,
-            origin_id=data['sourceId'],
-            defaults=defaults
-        )
-
-        if created:
-            self.logger.info('Created action %s' % action)
+            values['case'] = Ref(Case, data['caseId'])
 
-    def _import_contents(self, data, action_source_id):
-        self.logger.info('Importing action contents...')
+        return Action, data['sourceId'], values
 
+    def _parse_contents(self, data, action_source_id):
         for content_data in data:
 
             content_title = content_data['title']
@@ -148,122 +125,256 @@ class PaatosScraperImporter(Importer):
                 content_title = content_title[:255]
                 self.logger.warning('Truncated conetent title %s' % content_data['title'])
 
-            defaults = dict(
+            values = dict(
                 title=content_title,
                 hypertext=content_data['content'],
                 type='',
-                ordering=content_data['order']
+                ordering=content_data['order'],
+                action=Ref(Action, action_source_id),
             )
 
-            try:
-                action = Action.objects.get(origin_id=action_source_id)
-                defaults['action'] = action
-            except Action.DoesNotExist:
-                self.logger.error('Action %s does not exist' % action_source_id)
-                continue
-
-            content, created = Content.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=str(content_data['order']) + '-' + action_source_id,
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created content %s' % content)
-
-    def _import_attachments(self, data):
-        self.logger.info('Importing attachments...')
+            yield Content, str(content_data['order']) + '-' + action_source_id, values
 
+    def _parse_attachments(self, data):
         for attachment_data in data:
-            defaults = dict(
+            values = dict(
                 name=attachment_data['name'] or '',
                 url=attachment_data['url'],
                 number=attachment_data['number'],
                 public=attachment_data['public'],
                 confidentiality_reason=attachment_data['confidentialityReason'] or '',
+                action=Ref(Action, attachment_data['actionId']),
             )
 
-            try:
-                action = Action.objects.get(origin_id=attachment_data['actionId'])
-                defaults['action'] = action
-            except Action.DoesNotExist:
-                self.logger.error('Action %s does not exist' % attachment_data['actionId'])
-                continue
-
-            attachment, created = Attachment.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=attachment_data['sourceId'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created attachment %s' % attachment)
-
-    def _handle_organization(self, organization_path):
-        if os.path.isfile(organization_path):
-            with open(organization_path, 'r') as org_file:
-                self._import_organization(json.load(org_file))
-
-    def _handle_organization_cases(self, cases_path):
-        if os.path.isfile(cases_path):
-            with open(cases_path, 'r') as cases_file:
-                self._import_cases(json.load(cases_file))
-
-    def _handle_organization_events(self, events_path, organization_source_id):
-        if os.path.exists(events_path):
-            for event_source_id in os.listdir(events_path):
-                event_json_path = events_path + '/' + event_source_id + '/index.json'
-                if os.path.isfile(event_json_path):
-                    with open(event_json_path, 'r') as event_file:
-                        self._import_event(json.load(event_file), organization_source_id)
-                        action_folder = events_path + '/' + event_source_id + '/actions'
-                        self._handle_organization_event_actions(
-                            action_folder,
-                            organization_source_id,
-                            event_source_id)
-
-    def _handle_organization_event_actions(self, actions_path, organization_source_id, event_source_id):
-        if os.path.exists(actions_path):
-            for action_source_id in os.listdir(actions_path):
+            yield Attachment, attachment_data['sourceId'], values
+
+    @timed
+    def _handle_organization(self, records, organization_path):
+        if self.archive.isfile(organization_path):
+            records.append(self._parse_organization(self.archive.load_json(organization_path)))
+
+    @timed
+    def _handle_organization_cases(self, records, cases_path):
+        if self.archive.isfile(cases_path):
+            records.extend(self._parse_cases(self.archive.load_json(cases_path)))
+
+    @timed
+    def _handle_organization_event(self, records, events_path, organization_source_id, event_source_id):
+        event_json_path = events_path + '/' + event_source_id + '/index.json'
+        if self.archive.isfile(event_json_path):
+            records.append(self._parse_event(self.archive.load_json(event_json_path), organization_source_id))
+            action_folder = events_path + '/' + event_source_id + '/actions'
+            self._handle_organization_event_actions(
+                records,
+                action_folder,
+                organization_source_id,
+                event_source_id)
+
+    @timed
+    def _handle_organization_event_actions(self, records, actions_path, organization_source_id, event_source_id):
+        if self.archive.exists(actions_path):
+            for action_source_id in self.archive.listdir(actions_path):
                 action_file_path = actions_path + '/' + action_source_id + '/index.json'
                 contents_file_path = actions_path + '/' + action_source_id + '/contents.json'
                 attachment_file_path = actions_path + '/' + action_source_id + '/attachments.json'
-                if os.path.isfile(action_file_path):
-                    with open(action_file_path, 'r') as action_file:
-                        self._import_action(json.load(action_file))
-                        self._handle_contents(contents_file_path, action_source_id)
-                        self._handle_attachments(attachment_file_path)
-
-    def _handle_contents(self, contents_path, action_id):
-        if os.path.isfile(contents_path):
-            with open(contents_path, 'r') as contents_file:
-                self._import_contents(json.load(contents_file), action_id)
-
-    def _handle_attachments(self, attachment_path):
-        if os.path.isfile(attachment_path):
-            with open(attachment_path, 'r') as attachment_file:
-                self._import_attachments(json.load(attachment_file))
+                if self.archive.isfile(action_file_path):
+                    records.append(self._parse_action(self.archive.load_json(action_file_path)))
+                    self._handle_contents(records, contents_file_path, action_source_id)
+                    self._handle_attachments(records, attachment_file_path)
+
+    @timed
+    def _handle_contents(self, records, contents_path, action_id):
+        if self.archive.isfile(contents_path):
+            records.extend(self._parse_contents(self.archive.load_json(contents_path), action_id))
+
+    @timed
+    def _handle_attachments(self, records, attachment_path):
+        if self.archive.isfile(attachment_path):
+            records.extend(self._parse_attachments(self.archive.load_json(attachment_path)))
+
+
+_worker_parser = None
+
+
+def _init_worker(zip_path):
+    global _worker_parser
+    _worker_parser = PaatosScraperParser(ZipArchive(zip_path), logging.getLogger(__name__))
+
+
+def _parse_unit_in_worker(unit):
+    records = _worker_parser.parse_unit(unit)
+    timings, _worker_parser.timings = _worker_parser.timings, {}
+    return records, timings
+
+
+class PaatosScraperImporter(Importer):
+    def __init__(self, identifier, defaults, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data_source, created = DataSource.objects.get_or_create(
+            identifier=identifier,
+            defaults=defaults
+        )
+        if created:
+            self.logger.debug('Created new data source "%s"' % identifier)
+        self.organization_classes = {}
+
+    def _get_organization_class(self, name):
+        if name not in self.organization_classes:
+            classification = OrganizationClass.objects.filter(name__iexact=name).order_by('pk').first()
+            if classification is None:
+                raise ValueError('Unknown organization classification %s' % name)
+            self.organization_classes[name] = classification.pk
+        return self.organization_classes[name]
+
+    def _import_function(self, name, source_id):
+        self.logger.info('Importing function %s...' % source_id)
+
+        values = dict(
+            name=name,
+            function_id=source_id
+        )
+
+        self.upsert(Function, source_id, values)
+
+    def _write_record(self, record):
+        model, origin_id, values = record
+        if model is Organization:
+            values['classification'] = self._get_organization_class(values['classification'])
+            self.save_organization(values)
+            return
+
+        if model is Case:
+            function_id = values['function'].origin_id
+            if not self.has_origin_id(Function, function_id):
+                self._import_function(function_id, function_id)
+
+        self.upsert(model, origin_id, values)
+
+    def _parse_units(self, parser, units):
+        """
+        Yield (unit, records) for the given units in order.
+
+        With more than one worker the units are parsed in a process pool,
+        while this process only writes the results.
+        """
+        workers = self.options.get('workers') or 1
+        # Validation runs in a single transaction, which forking workers would have to close
+        if workers <= 1 or self.validation:
+            for unit in units:
+                yield unit, parser.parse_unit(unit)
+            return
+
+        def collect(unit, result):
+            records, timings = result.get()
+            for name, seconds in timings.items():
+                parser.timings[name] = parser.timings.get(name, 0.0) + seconds
+            return unit, records
+
+        # Forked workers must not share the database connection of this process
+        connections.close_all()
+
+        pool = multiprocessing.Pool(workers, _init_worker, (self.options['zipfile'],))
+        try:
+            pending = deque()
+            for unit in units:
+                pending.append((unit, pool.apply_async(_parse_unit_in_worker, (unit,))))
+                if len(pending) >= workers * PENDING_UNITS_PER_WORKER:
+                    yield collect(*pending.popleft())
+            while pending:
+                yield collect(*pending.popleft())
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _group_by_unit(self, members):
+        units = {}
+        for path, (crc, size) in members.items():
+            unit = PaatosScraperParser.unit_of(path)
+            if unit is not None:
+                units.setdefault(unit, []).append((path, crc, size))
+        return {unit: sorted(files) for unit, files in units.items()}
+
+    def _exclude_unchanged_units(self, units, members):
+        """
+        Return the units whose files differ from the previous successfully imported archive.
+        """
+        if self.options['flush'] or self.options.get('full'):
+            return units
+        try:
+            previous = self.data_source.import_manifest.members
+        except ImportManifest.DoesNotExist:
+            return units
+
+        previous_units = self._group_by_unit(previous)
+        current_units = self._group_by_unit(members)
+        changed = [unit for unit in units if current_units.get(unit) != previous_units.get(unit)]
+
+        unchanged = set(units) - set(changed)
+        unchanged_events = len([unit for unit in unchanged if unit[1] is not None])
+        self.logger.info('Skipping %d organizations and %d events unchanged since the last import' % (
+            len(unchanged) - unchanged_events, unchanged_events))
+
+        return changed
+
+    def _write_unit(self, parsed_unit):
+        (organization_source_id, event_source_id), records = parsed_unit
+        if event_source_id is None:
+            self.logger.info('Importing organization %s...' % organization_source_id)
+        for record in records:
+            try:
+                with transaction.atomic():
+                    self._write_record(record)
+            except INVALID_RECORD_ERRORS as e:
+                self.report_error('Skipping invalid record %s: %s' % (repr(record)[:200], e))
+
+    def _import_units(self, parser, units):
+        # Units are committed whole, so those committed by an interrupted import are not even parsed
+        units = units[self.get_committed_position():]
+        self.run_in_batches(self._parse_units(parser, units), self._write_unit,
+                            weight=lambda parsed_unit: len(parsed_unit[1]), omits_committed=True)
+
+    def _flush(self):
+        self.flush_data(Function, Event, CaseGeometry, Action, Content, Attachment)
+        ImportManifest.objects.filter(data_source=self.data_source).delete()
+
+    def _finish(self, members):
+        # Parents of organizations written before them are set here, before the manifest is saved
+        for model in (Organization, Function, Case, Event, Action, Content, Attachment):
+            self.finish_upserts(model)
+        self.rebuild_hierarchies(Organization, Function)
+
+        if self.validation:
+            return
+        # Units with skipped records must not look unchanged to the next import, which would not retry them
+        skipped = self._get_row_counts()[2] + self.errors
+        if skipped:
+            self.logger.warning('%d records were skipped, keeping the manifest of the last import' % skipped)
+            return
+        ImportManifest.objects.update_or_create(data_source=self.data_source, defaults={'members': members})
 
     def import_data(self):
         self.logger.info('Importing data...')
 
+        self.start_checkpoint(self.options['zipfile'])
+
         if self.options['flush']:
             self.logger.info('Deleting all objects first...')
-            Function.objects.all().delete()
-            Event.objects.all().delete()
-            CaseGeometry.objects.all().delete()
-            Action.objects.all().delete()
-            Content.objects.all().delete()
-            Attachment.objects.all().delete()
-
-        with tempfile.TemporaryDirectory() as temp_dirpath:
-            zip_ref = zipfile.ZipFile(self.options['zipfile'], 'r')
-            zip_ref.extractall(temp_dirpath)
-            zip_ref.close()
-            for organization_source_id in os.listdir(temp_dirpath + '/organizations'):
-                current_path = temp_dirpath + '/organizations/' + organization_source_id
-                self._handle_organization(current_path + '/index.json')
-                self._handle_organization_cases(current_path + '/cases.json')
-                self._handle_organization_events(current_path + '/events', organization_source_id)
+            self.run_stage('flush', self._flush)
+
+        with ZipArchive(self.options['zipfile']) as archive:
+            with self.stage('index'):
+                parser = PaatosScraperParser(archive, self.logger)
+                members = {path: [info.CRC, info.file_size] for path, info in archive.files.items()}
+                units = self._exclude_unchanged_units(list(parser.iter_units()), members)
+
+            self.run_stage('import', self._import_units, parser, units)
+            self.run_stage('finish', self._finish, members)
+            self.run_stage('search', self.refresh_search_vectors)
+            self.finish_checkpoint()
+
+            # Parsing is part of the import stage, or done in the worker processes
+            for name, seconds in parser.timings.items():
+                self.stats.add_time('parse: %s' % name, seconds)
 
             self.logger.info('Import done!')
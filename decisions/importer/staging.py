@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+import io
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxLengthValidator, MaxValueValidator, MinValueValidator
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .base import DEFAULT_BATCH_SIZE, get_default_fields, Ref, source_hash
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+# Validators checked before staging, so that rows the database would refuse are skipped one by one
+STAGED_VALIDATORS = (MaxLengthValidator, MaxValueValidator, MinValueValidator)
+
+
+def copy_text(value):
+    """
+    Return value formatted as a field of COPY's text format.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).translate(COPY_ESCAPES)
+
+
+class StagingUpserter(object):
+    """
+    Loads objects of one model through a temporary staging table.
+
+    Objects are streamed into the staging table with COPY as batches fill
+    up, and merged into the model's table with a single set-based
+    INSERT ... SELECT ... ON CONFLICT once the whole model has been
+    imported. References are resolved by joining on origin_id, so the
+    referred objects never have to be loaded in memory. The rows written
+    and their source hashes are the same as with BulkUpserter.
+
+    The staging table belongs to the database session, so concurrent
+    imports never share it, and it outlives the commits of the batches.
+
+    All objects must have the same fields and their foreign keys must be
+    given as required Refs or None. Staged objects cannot be referred to
+    before they are merged.
+    """
+
+    def __init__(self, model, data_source, get_queryset, on_merge, logger, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.data_source = data_source
+        self.get_queryset = get_queryset
+        self.on_merge = on_merge
+        self.logger = logger
+        self.batch_size = batch_size
+        self.table = '%s_staging' % model._meta.db_table
+        self.pending = {}
+        self.names = None
+        self.table_created = False
+        self.buffer = io.StringIO()
+        self.buffered = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        # Optional references cannot be staged, so there are never any left to resolve
+        self.unresolved = {}
+
+    def _set_fields(self, names):
+        self.names = names
+        self.fields = [self.model._meta.get_field(name) for name in names]
+        self.columns = ['origin_id', 'source_hash'] + [field.column for field in self.fields]
+
+    def _create_table(self):
+        # Created on the first flush, as objects may be added in a savepoint that is rolled back
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS pg_temp.%s' % quote(self.table))
+            cursor.execute('CREATE TEMPORARY TABLE %s (seq bigserial, %s)' % (
+                quote(self.table), ', '.join('%s text' % quote(column) for column in self.columns)))
+        self.table_created = True
+
+    def add(self, origin_id, values):
+        names = sorted(values)
+        if self.names is None:
+            self._set_fields(names)
+        elif names != self.names:
+            raise ValueError('%s %s does not have the same fields as the objects before it' % (
+                self.model.__name__, origin_id))
+
+        row = []
+        hashed = {}
+        for name, field in zip(self.names, self.fields):
+            value = values[name]
+            if field.is_relation:
+                if isinstance(value, Ref):
+                    if not value.required:
+                        raise ValueError('Optional references cannot be staged')
+                    if value.origin_id is None:
+                        self.logger.error('Cannot import %s %s, %s %s does not exist' % (
+                            self.model.__name__, origin_id, value.model.__name__, value.origin_id))
+                        self.skipped += 1
+                        return
+                    value = value.origin_id
+                elif value is not None:
+                    raise ValueError('%s of %s must be given as a Ref' % (name, self.model.__name__))
+            else:
+                try:
+                    value = field.get_db_prep_save(value, connection)
+                    if value is not None:
+                        for validator in field.validators:
+                            if isinstance(validator, STAGED_VALIDATORS):
+                                validator(value)
+                except (TypeError, ValueError, ValidationError) as e:
+                    self.logger.error('Cannot import %s %s, invalid value: %s' % (self.model.__name__, origin_id, e))
+                    self.skipped += 1
+                    return
+            hashed[name] = value if field.is_relation else values[name]
+            row.append(value)
+
+        row = [origin_id, source_hash(hashed)] + row
+        self.buffer.write('\t'.join(copy_text(value) for value in row) + '\n')
+        self.buffered += 1
+
+    def is_full(self):
+        return self.buffered >= self.batch_size
+
+    def flush(self):
+        if not self.buffered:
+            return
+        if not self.table_created:
+            self._create_table()
+        quote = connection.ops.quote_name
+        self.buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert('COPY %s (%s) FROM STDIN' % (
+                quote(self.table), ', '.join(quote(column) for column in self.columns)), self.buffer)
+        self.buffer = io.StringIO()
+        self.buffered = 0
+
+    def _get_joins(self):
+        """
+        Return the FROM clause resolving the staged references, its params and the resolved column expressions.
+        """
+        quote = connection.ops.quote_name
+        joins = []
+        params = []
+        expressions = []
+        for i, field in enumerate(self.fields):
+            column = 's.%s' % quote(field.column)
+            if not field.is_relation:
+                db_type = field.db_type(connection)
+                # text is assigned to character columns as is, the other types need a cast
+                if not db_type.startswith('varchar'):
+                    column = 'CAST(%s AS %s)' % (column, db_type)
+                expressions.append(column)
+                continue
+
+            queryset = self.get_queryset(field.related_model).exclude(origin_id=None).values_list('origin_id', 'pk')
+            sql, query_params = queryset.query.sql_with_params()
+            alias = 'r%d' % i
+            joins.append('LEFT JOIN (SELECT DISTINCT ON (q.origin_id) q.origin_id, q.pk FROM (%s) q (origin_id, pk) '
+                         'ORDER BY q.origin_id, q.pk) %s ON %s.origin_id = %s' % (sql, alias, alias, column))
+            params.extend(query_params)
+            expressions.append('%s.pk' % alias)
+        return ' '.join(joins), params, expressions
+
+    def finish(self):
+        """
+        Merge the staged objects into the model's table and drop the staging table.
+        """
+        self.flush()
+        if not self.table_created:
+            # Nothing was staged, every object added was skipped
+            self.names = None
+            return
+
+        quote = connection.ops.quote_name
+        joins, params, expressions = self._get_joins()
+        references = [(field, 's.%s' % quote(field.column), expression)
+                      for field, expression in zip(self.fields, expressions) if field.is_relation]
+        default_fields = get_default_fields(self.model, self.names)
+        now = timezone.now()
+
+        # The latest staged version of each object
+        staged = 'SELECT DISTINCT ON (origin_id) * FROM {table} ORDER BY origin_id, seq DESC'.format(
+            table=quote(self.table))
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if references:
+                cursor.execute('WITH staged AS ({staged}) SELECT {counts} FROM staged s {joins}'.format(
+                    staged=staged,
+                    counts=', '.join('count(*) FILTER (WHERE %s IS NOT NULL AND %s IS NULL)' % (staged_column, pk)
+                                     for field, staged_column, pk in references),
+                    joins=joins,
+                ), params)
+                for (field, staged_column, pk), count in zip(references, cursor.fetchone()):
+                    if count:
+                        self.logger.error('Cannot import %d %s objects, their %s does not exist' % (
+                            count, self.model.__name__, field.related_model.__name__))
+
+            columns = ['data_source_id', 'origin_id', 'created_at', 'modified_at', 'source_hash']
+            columns += [field.column for field in self.fields]
+            updated_columns = columns[3:]
+            columns += [field.column for field in default_fields]
+
+            defaults = [field.get_db_prep_save(field.get_default(), connection) for field in default_fields]
+            values = ['%s', 'origin_id', '%s', '%s', 'source_hash'] + ['c%d' % i for i in range(len(self.fields))]
+            values += ['CAST(%s AS {})'.format(field.db_type(connection)) for field in default_fields]
+
+            table = quote(self.model._meta.db_table)
+            sql = '''
+                WITH staged AS ({staged}),
+                resolved AS (
+                    SELECT s.origin_id, s.source_hash, {expressions} FROM staged s {joins}
+                    WHERE {conditions}
+                ),
+                merged AS (
+                    INSERT INTO {table} ({columns}) SELECT {values} FROM resolved
+                    ON CONFLICT ({data_source}, {origin_id}) DO UPDATE SET {updates}
+                    WHERE {table}.{source_hash} IS DISTINCT FROM EXCLUDED.{source_hash}
+                    RETURNING xmax = 0 AS created
+                )
+                SELECT (SELECT count(*) FROM staged), (SELECT count(*) FROM resolved),
+                       count(*) FILTER (WHERE created), count(*) FILTER (WHERE NOT created) FROM merged
+            '''.format(
+                staged=staged,
+                expressions=', '.join('%s AS c%d' % (expression, i) for i, expression in enumerate(expressions)),
+                joins=joins,
+                conditions=' AND '.join(['TRUE'] + ['(%s IS NULL OR %s IS NOT NULL)' % (staged_column, pk)
+                                                    for field, staged_column, pk in references]),
+                table=table,
+                columns=', '.join(quote(column) for column in columns),
+                values=', '.join(values),
+                data_source=quote('data_source_id'),
+                origin_id=quote('origin_id'),
+                updates=', '.join('{0} = EXCLUDED.{0}'.format(quote(column)) for column in updated_columns),
+                source_hash=quote('source_hash'),
+            )
+            cursor.execute(sql, params + [self.data_source.pk, now, now] + defaults)
+            staged_count, resolved_count, created, updated = cursor.fetchone()
+            cursor.execute('DROP TABLE pg_temp.%s' % quote(self.table))
+
+        self.created += created
+        self.updated += updated
+        self.unchanged += resolved_count - created - updated
+        self.skipped += staged_count - resolved_count
+        self.names = None
+        self.table_created = False
+        self.on_merge(self.model)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import functools
+import resource
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.utils import CursorWrapper
+from django.utils import timezone
+
+COLUMNS = (
+    ('stage', 'Stage'),
+    ('wall_time', 'Time (s)'),
+    ('rows_read', 'Read'),
+    ('rows_written', 'Written'),
+    ('rows_unchanged', 'Unchanged'),
+    ('rows_skipped', 'Skipped'),
+    ('queries', 'Queries'),
+    ('query_time', 'SQL (s)'),
+    ('memory_growth', 'Peak +MiB'),
+    ('peak_memory', 'Process peak MiB'),
+)
+
+
+def get_peak_memory():
+    """
+    Return the peak resident set size of this process in MiB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(method):
+    """
+    Add the time spent in the decorated method to the `timings` dict of its object.
+
+    Time spent in other timed methods it calls is only added to theirs, so
+    the timings of nested methods never count the same time twice.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Time spent in the timed methods being called, innermost last
+        nested = self.__dict__.setdefault('_timed_nested', [])
+        nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            self.timings[method.__name__] = self.timings.get(method.__name__, 0.0) + own
+    return wrapper
+
+
+class CountingCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, db, counter):
+        super().__init__(cursor, db)
+        self.counter = counter
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.counter.queries += 1
+            self.counter.query_time += time.perf_counter() - start
+
+    def execute(self, sql, params=None):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(super().executemany, sql, param_list)
+
+    def copy_expert(self, sql, file):
+        return self._timed(self.cursor.copy_expert, sql, file)
+
+
+class StageStats(object):
+    def __init__(self, stage):
+        self.stage = stage
+        self.wall_time = 0.0
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_unchanged = 0
+        self.rows_skipped = 0
+        self.queries = 0
+        self.query_time = 0.0
+        # How much the stage raised the peak memory of the process, and the peak of the process after it
+        self.memory_growth = 0.0
+        self.peak_memory = 0.0
+
+    def as_dict(self):
+        return OrderedDict((name, getattr(self, name)) for name, title in COLUMNS)
+
+
+class ImportStats(object):
+    """
+    Collects wall time, row counts, SQL queries and peak memory of import stages.
+
+    The peak resident set size only ever grows over the life of the
+    process, so each stage records how much it raised the peak as well as
+    the peak itself.
+
+    `get_row_counts` is called at the start and end of each stage and
+    should return the current total (written, unchanged, skipped) rows.
+    """
+
+    def __init__(self, get_row_counts):
+        self.get_row_counts = get_row_counts
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        self.start_peak_memory = get_peak_memory()
+        self.stages = OrderedDict()
+        self.current = None
+
+    def get_stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Add everything done in the block to the stage with the given name.
+        """
+        stage = self.get_stage(name)
+        previous, self.current = self.current, stage
+        counts = self.get_row_counts()
+        start = time.perf_counter()
+        start_peak_memory = get_peak_memory()
+
+        # Cursors of the connection count their queries while the stage runs
+        db = connections[DEFAULT_DB_ALIAS]
+        previous_factory = db.__dict__.get('make_debug_cursor')
+        had_debug_cursor = db.force_debug_cursor
+        db.make_debug_cursor = lambda cursor: CountingCursorWrapper(cursor, db, stage)
+        db.force_debug_cursor = True
+        try:
+            yield stage
+        finally:
+            if previous_factory is None:
+                del db.make_debug_cursor
+            else:
+                db.make_debug_cursor = previous_factory
+            db.force_debug_cursor = had_debug_cursor
+            stage.wall_time += time.perf_counter() - start
+            written, unchanged, skipped = (new - old for new, old in zip(self.get_row_counts(), counts))
+            stage.rows_written += written
+            stage.rows_unchanged += unchanged
+            stage.rows_skipped += skipped
+            stage.peak_memory = get_peak_memory()
+            stage.memory_growth += stage.peak_memory - start_peak_memory
+            self.current = previous
+
+    def add_read(self, count):
+        if self.current is not None:
+            self.current.rows_read += count
+
+    def add_time(self, name, seconds):
+        """
+        Record time spent outside of measured blocks, e.g. in worker processes.
+        """
+        self.get_stage(name).wall_time += seconds
+
+    def get_total(self):
+        total = StageStats('total')
+        total.wall_time = time.perf_counter() - self.start
+        for stage in self.stages.values():
+            for name in ('rows_read', 'rows_written', 'rows_unchanged', 'rows_skipped', 'queries', 'query_time'):
+                setattr(total, name, getattr(total, name) + getattr(stage, name))
+        total.peak_memory = get_peak_memory()
+        total.memory_growth = total.peak_memory - self.start_peak_memory
+        return total
+
+    def as_dict(self):
+        return OrderedDict([
+            ('started_at', self.started_at.isoformat()),
+            ('stages', [stage.as_dict() for stage in self.stages.values()]),
+            ('total', self.get_total().as_dict()),
+        ])
+
+    def format_table(self):
+        rows = [[title for name, title in COLUMNS]]
+        for stage in list(self.stages.values()) + [self.get_total()]:
+            row = []
+            for name, value in stage.as_dict().items():
+                row.append('%.2f' % value if isinstance(value, float) else str(value))
+            rows.append(row)
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+        lines = []
+        for row in rows:
+            cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+            lines.append('  '.join(cells))
+        lines.insert(1, '-' * len(lines[0]))
+        lines.insert(-1, '-' * len(lines[0]))
+        return '\n'.join(lines)
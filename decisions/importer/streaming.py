@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import codecs
+import json
+import re
+from collections import deque, OrderedDict
+from itertools import accumulate, chain, islice
+
+CHUNK_SIZE = 1024 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+DECODER = json.JSONDecoder()
+
+# Skipped values are scanned as bytes, UTF-8 never encodes other characters with the ASCII bytes looked for
+NOT_BRACKETS = bytes(byte for byte in range(256) if byte not in b'[]{}')
+DEPTH_CHANGES = {ord('['): 1, ord('{'): 1, ord(']'): -1, ord('}'): -1}
+# Anything up to and including the next bracket outside of strings
+NEXT_BRACKET = re.compile(br'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*[\[\]{}]', re.DOTALL)
+
+
+def _last_quote(data):
+    """
+    Return the index of the last quote in data that is not escaped.
+    """
+    index = data.rfind(b'"')
+    while True:
+        start = index
+        while start and data[start - 1] == ord('\\'):
+            start -= 1
+        if (index - start) % 2 == 0:
+            return index
+        index = data.rfind(b'"', 0, start)
+
+
+class _Stream(object):
+    """
+    Incrementally decoded view of a UTF-8 JSON file starting at a byte offset.
+    """
+
+    def __init__(self, fileobj, offset=0, chunk_size=CHUNK_SIZE):
+        self.file = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.seek(offset)
+
+    def seek(self, offset):
+        self.file.seek(offset)
+        self.decoder.reset()
+        self.buffer = ''
+        self.pos = 0
+        self.offset = offset
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        if self.pos:
+            self.offset += len(self.buffer[:self.pos].encode('utf-8'))
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer += self.decoder.decode(chunk, final=self.eof)
+        return True
+
+    def tell(self):
+        return self.offset + len(self.buffer[:self.pos].encode('utf-8'))
+
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected %r at byte %d, found %r' % (char, self.tell(), found))
+        self.pos += 1
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.fill():
+                    continue
+                raise
+            # a number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """
+        Move past the next value without decoding it.
+
+        Arrays and objects are skipped by counting their brackets outside of
+        strings in the raw bytes of the file, a chunk at a time, so the value
+        is assumed to be valid JSON.
+        """
+        if self.peek() not in ('[', '{'):
+            self.decode_value()
+            return
+        offset = self.tell()
+        self.file.seek(offset)
+        data = b''
+        depth = 0
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                raise ValueError('Unexpected end of file at byte %d' % (offset + len(data)))
+            data += chunk
+            # Without escaped backslashes and quotes every other part split by quotes is in a string
+            text = data.replace(b'\\\\', b'').replace(b'\\"', b'') if b'\\' in data else data
+            parts = text.split(b'"')
+            brackets = b''.join(parts[0::2]).translate(None, NOT_BRACKETS)
+            depths = list(accumulate(chain([depth], map(DEPTH_CHANGES.__getitem__, brackets))))
+            if 0 in depths[1:]:
+                # The value ends with the bracket bringing the depth back to zero
+                last = deque(islice(NEXT_BRACKET.finditer(data), depths.index(0, 1)), maxlen=1)[0]
+                self.seek(offset + last.end())
+                return
+            depth = depths[-1]
+            # A string continuing in the next chunk is scanned again with it
+            kept = _last_quote(data) if len(parts) % 2 == 0 else len(data)
+            offset += kept
+            data = data[kept:]
+
+    def iter_array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError('Expected "," or "]" at byte %d, found %r' % (self.tell() - 1, separator))
+
+
+class JSONSectionReader(object):
+    """
+    Mapping-like access to the top-level members of a large JSON object file.
+
+    The file is scanned once to find out where each member's value starts,
+    skipping the values of members other than resident ones without
+    decoding them.
+    Members listed in `resident` are kept in memory, other array members are
+    read from the file one item at a time every time they are accessed, so
+    memory use does not grow with the size of the file.
+    """
+
+    def __init__(self, filename, resident=(), chunk_size=CHUNK_SIZE):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.resident = {}
+        self.offsets = OrderedDict()
+        self._scan(set(resident))
+
+    def _scan(self, resident):
+        with open(self.filename, 'rb') as data_file:
+            stream = _Stream(data_file, chunk_size=self.chunk_size)
+            stream.expect('{')
+            if stream.peek() == '}':
+                return
+            while True:
+                key = stream.decode_value()
+                stream.expect(':')
+                stream.peek()
+                self.offsets[key] = stream.tell()
+
+                if key in resident:
+                    self.resident[key] = stream.decode_value()
+                else:
+                    stream.skip_value()
+
+                separator = stream.peek()
+                stream.pos += 1
+                if separator == '}':
+                    return
+                if separator != ',':
+                    raise ValueError('Expected "," or "}" at byte %d, found %r' % (stream.tell() - 1, separator))
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __getitem__(self, key):
+        if key in self.resident:
+            return self.resident[key]
+        if key not in self.offsets:
+            raise KeyError(key)
+        return self.iter_items(key)
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def load(self, key):
+        """
+        Return the whole value of the given member.
+        """
+        if key in self.resident:
+            return self.resident[key]
+        with open(self.filename, 'rb') as data_file:
+            return _Stream(data_file, self.offsets[key], self.chunk_size).decode_value()
+
+    def iter_items(self, key):
+        """
+        Yield the items of the given array member one at a time.
+        """
+        with open(self.filename, 'rb') as data_file:
+            stream = _Stream(data_file, self.offsets[key], self.chunk_size)
+            if stream.peek() != '[':
+                raise ValueError('Member "%s" is not an array' % key)
+            for item in stream.iter_array():
+                yield item
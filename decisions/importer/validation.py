@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict, OrderedDict
+
+
+class ValidationIndex(object):
+    """
+    Index of the objects and references of a source, for validating it without writing anything.
+
+    Every object the importer would write is recorded by its origin_id and
+    every reference by the origin_id it refers to. References are checked
+    once the whole source has been read, against the objects of the source
+    and the objects already in the database, so references to objects
+    later in the source are not reported.
+    """
+
+    def __init__(self, get_existing_origin_ids):
+        self.get_existing_origin_ids = get_existing_origin_ids
+        self.origin_ids = defaultdict(set)
+        self.duplicates = defaultdict(list)
+        # referred model -> {origin_id: [reference count, first referrer]}
+        self.references = defaultdict(OrderedDict)
+        self.errors = 0
+
+    def add(self, model, origin_id, references):
+        """
+        Record an object and its references, given as (field name, Ref) pairs.
+        """
+        origin_ids = self.origin_ids[model]
+        if origin_id in origin_ids:
+            self.duplicates[model].append(origin_id)
+        origin_ids.add(origin_id)
+        for name, ref in references:
+            self.add_reference(ref, '%s %s (%s)' % (model.__name__, origin_id, name))
+
+    def add_reference(self, ref, referrer):
+        references = self.references[ref.model]
+        if ref.origin_id in references:
+            references[ref.origin_id][0] += 1
+        else:
+            references[ref.origin_id] = [1, referrer]
+
+    def report(self, logger):
+        """
+        Log all duplicates, dangling references and other errors and return their number.
+        """
+        problems = self.errors
+
+        for model, duplicates in self.duplicates.items():
+            problems += len(duplicates)
+            for origin_id in duplicates:
+                logger.error('%s %s is listed more than once' % (model.__name__, origin_id))
+
+        for model, references in self.references.items():
+            known = self.origin_ids[model]
+            existing = self.get_existing_origin_ids(model)
+            for origin_id, (count, referrer) in references.items():
+                if origin_id in known or origin_id in existing:
+                    continue
+                problems += 1
+                others = ' and %d other objects' % (count - 1) if count > 1 else ''
+                logger.error('%s %s does not exist, referred to by %s%s' % (
+                    model.__name__, origin_id, referrer, others))
+
+        counts = ', '.join('%d %s' % (len(origin_ids), model.__name__) for model, origin_ids in self.origin_ids.items())
+        logger.info('Validated %s: %d problems' % (counts or 'nothing', problems))
+        return problems
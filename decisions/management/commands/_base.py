@@ -0,0 +1,112 @@
+import json
+
+from django.core.management import get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from decisions.importer.base import DEFAULT_BATCH_SIZE
+from decisions.importer.locks import data_source_lock, ImportLocked
+from decisions.importer.paatos_scraper import PaatosScraperImporter
+
+
+class ImportCommand(BaseCommand):
+    """
+    Base class for commands running an importer.
+
+    Subclasses set the importer class in `importer_class`, any arguments it
+    takes besides the options in `get_importer_kwargs`, and run the importer
+    in `run_importer`.
+    """
+    importer_class = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=DEFAULT_BATCH_SIZE,
+                            help='Number of records written and committed at a time')
+        parser.add_argument('--stats-file', type=str, dest='stats_file', default=None,
+                            help='Write the import statistics to this file as JSON')
+        parser.add_argument('--validate-only', action='store_true', dest='validate_only', default=False,
+                            help='Only check the data for duplicates and references to missing objects')
+
+    def get_importer_kwargs(self):
+        return {}
+
+    def create_importer(self, options):
+        return self.importer_class(options=options, **self.get_importer_kwargs())
+
+    def run_importer(self, importer, options):
+        importer.import_data()
+
+    def handle(self, *args, **options):
+        if not options['validate_only']:
+            importer = self.create_importer(options)
+            self.run_importer(importer, options)
+            self.report_stats(importer, options)
+            return
+
+        # Whatever the importer does besides writing objects is rolled back
+        with transaction.atomic():
+            importer = self.create_importer(options)
+            self.run_importer(importer, options)
+            problems = importer.validation.report(importer.logger)
+            transaction.set_rollback(True)
+        if problems:
+            raise CommandError('Validation failed, %d problems found' % problems)
+        self.stdout.write('No problems found')
+
+    def report_stats(self, importer, options):
+        """
+        Print the statistics of a finished import and write them to --stats-file if given.
+        """
+        if options['verbosity'] > 0:
+            self.stdout.write(importer.stats.format_table())
+        if options.get('stats_file'):
+            with open(options['stats_file'], 'w') as stats_file:
+                json.dump(importer.stats.as_dict(), stats_file, indent=2)
+
+
+class ScraperImportCommand(ImportCommand):
+    """
+    Base class for commands importing Paatos scraper archives of a data source.
+    """
+    importer_class = PaatosScraperImporter
+    data_source_identifier = None
+    data_source_name = None
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('zipfile', type=str)
+        parser.add_argument('--flush', action='store_true', dest='flush', default=False,
+                            help='Delete all existing objects first')
+        parser.add_argument('--workers', type=int, dest='workers', default=1,
+                            help='Number of processes parsing the archive in parallel')
+        parser.add_argument('--full', action='store_true', dest='full', default=False,
+                            help='Import all files, also those unchanged since the last successful import')
+        parser.add_argument('--resume', action='store_true', dest='resume', default=False,
+                            help='Continue an interrupted import of the same archive where it stopped')
+
+    def handle(self, *args, **options):
+        try:
+            with data_source_lock(self.data_source_identifier):
+                super().handle(*args, **options)
+        except ImportLocked as e:
+            raise CommandError(str(e))
+
+    def get_importer_kwargs(self):
+        return {
+            'identifier': self.data_source_identifier,
+            'defaults': dict(name=self.data_source_name),
+        }
+
+
+def get_scraper_commands():
+    """
+    Return the scraper import commands of this app by their data source identifier.
+    """
+    commands = {}
+    for name, app_name in get_commands().items():
+        if app_name != 'decisions' or not name.startswith('import_'):
+            continue
+        command = load_command_class(app_name, name)
+        if isinstance(command, ScraperImportCommand):
+            commands[command.data_source_identifier] = command
+    return commands
@@ -0,0 +1,50 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from decisions.importer.base import DEFAULT_BATCH_SIZE
+from decisions.importer.benchmark import DEFAULT_SCALE, run_benchmarks, Scale
+
+COLUMNS = (
+    ('importer', 'Importer', '%s'),
+    ('rows', 'Rows', '%d'),
+    ('seconds', 'Time (s)', '%.2f'),
+    ('rows_per_second', 'Rows/s', '%.0f'),
+    ('queries_per_row', 'Queries/row', '%.3f'),
+    ('peak_rss', 'Peak RSS MiB', '%.0f'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Imports generated data into a throwaway database and reports the performance of the importers'
+
+    def add_arguments(self, parser):
+        for name in Scale._fields:
+            parser.add_argument('--%s' % name.replace('_', '-'), type=int, dest=name,
+                                default=getattr(DEFAULT_SCALE, name))
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, dest='workers', default=1,
+                            help='Number of processes parsing the scraper archive')
+        parser.add_argument('--fast-load', action='store_true', dest='fast_load', default=False,
+                            help='Import Open Ahjo data with --fast-load')
+        parser.add_argument('--output', type=str, dest='output', default=None,
+                            help='Write the results to this file as JSON')
+
+    def handle(self, *args, **options):
+        scale = Scale(**{name: options[name] for name in Scale._fields})
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmarks(directory, scale, batch_size=options['batch_size'], workers=options['workers'],
+                                     fast_load=options['fast_load'], seed=options['seed'])
+
+        rows = [[title for name, title, format in COLUMNS]]
+        rows += [[format % result[name] for name, title, format in COLUMNS] for result in results]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+        for row in rows:
+            self.stdout.write('  '.join([row[0].ljust(widths[0])] +
+                                        [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'scale': scale._asdict(), 'results': results}, output, indent=2)
@@ -1,15 +1,16 @@
-from django.core.management.base import BaseCommand
-
 from decisions.importer.helsinki import HelsinkiImporter
 
+from ._base import ImportCommand
+
 
-class Command(BaseCommand):
+class Command(ImportCommand):
     help = 'Imports Helsinki organizations'
+    importer_class = HelsinkiImporter
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument('filename', type=str)
         parser.add_argument('--include-people', action='store_true', dest='include_people', default=False)
 
-    def handle(self, *args, **options):
-        importer = HelsinkiImporter(options)
+    def run_importer(self, importer, options):
         importer.import_organizations(options['filename'])
@@ -1,16 +1,20 @@
-from django.core.management.base import BaseCommand
-
 from decisions.importer.open_ahjo import OpenAhjoImporter
 
+from ._base import ImportCommand
+
 
-class Command(BaseCommand):
+class Command(ImportCommand):
     help = 'Imports Open Ahjo data'
+    importer_class = OpenAhjoImporter
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument('filename', type=str)
         parser.add_argument('--flush', action='store_true', dest='flush', default=False,
                             help='Delete all existing objects first')
-
-    def handle(self, *args, **options):
-        importer = OpenAhjoImporter(options)
-        importer.import_data()
+        parser.add_argument('--stream', action='store_true', dest='stream', default=False,
+                            help='Read the file one record at a time instead of loading it all in memory')
+        parser.add_argument('--fast-load', action='store_true', dest='fast_load', default=False,
+                            help='Load actions, contents and attachments through staging tables with COPY')
+        parser.add_argument('--resume', action='store_true', dest='resume', default=False,
+                            help='Continue an interrupted import of the same file where it stopped')
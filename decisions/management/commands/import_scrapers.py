@@ -0,0 +1,110 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from decisions.importer.base import DEFAULT_BATCH_SIZE
+from decisions.importer.locks import data_source_lock, ImportLocked
+
+from ._base import get_scraper_commands
+
+COLUMNS = (
+    ('source', 'Source', '%s'),
+    ('status', 'Status', '%s'),
+    ('seconds', 'Time (s)', '%.2f'),
+    ('rows_read', 'Read', '%d'),
+    ('rows_written', 'Written', '%d'),
+    ('rows_unchanged', 'Unchanged', '%d'),
+    ('rows_skipped', 'Skipped', '%d'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Imports the Paatos scraper archives of several data sources concurrently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('config', type=str,
+                            help='JSON file mapping data source identifiers to the paths of their archives')
+        parser.add_argument('--concurrency', type=int, dest='concurrency', default=2,
+                            help='Number of data sources imported at the same time')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=DEFAULT_BATCH_SIZE,
+                            help='Number of records written and committed at a time')
+        parser.add_argument('--workers', type=int, dest='workers', default=1,
+                            help='Number of processes parsing each archive in parallel, only with --concurrency 1')
+        parser.add_argument('--full', action='store_true', dest='full', default=False,
+                            help='Import all files, also those unchanged since the last successful import')
+        parser.add_argument('--resume', action='store_true', dest='resume', default=False,
+                            help='Continue interrupted imports of the same archives where they stopped')
+
+    def handle(self, *args, **options):
+        # Forking worker processes from one of several threads can leave locks, e.g. those of logging, held forever
+        if options['workers'] > 1 and options['concurrency'] > 1:
+            raise CommandError('--workers cannot be used with --concurrency greater than 1')
+        with open(options['config']) as config_file:
+            sources = json.load(config_file)
+        commands = get_scraper_commands()
+        unknown = sorted(set(sources) - set(commands))
+        if unknown:
+            raise CommandError('Unknown data sources: %s, known ones are %s' % (
+                ', '.join(unknown), ', '.join(sorted(commands))))
+
+        importer_options = {
+            'verbosity': options['verbosity'],
+            'batch_size': options['batch_size'],
+            'workers': options['workers'],
+            'full': options['full'],
+            'resume': options['resume'],
+            'flush': False,
+        }
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            futures = [executor.submit(self.import_source, commands[identifier], dict(importer_options, zipfile=path))
+                       for identifier, path in sorted(sources.items())]
+            results = [future.result() for future in futures]
+
+        self.write_summary(results)
+        failed = [result['source'] for result in results if result['status'] == 'failed']
+        if failed:
+            raise CommandError('Importing %s failed' % ', '.join(failed))
+
+    def import_source(self, command, options):
+        """
+        Import one data source, returning a summary instead of raising on failure.
+        """
+        identifier = command.data_source_identifier
+        logger = logging.getLogger('decisions.importer')
+        result = {'source': identifier, 'status': 'done', 'seconds': 0.0}
+        start = time.perf_counter()
+        try:
+            with data_source_lock(identifier):
+                importer = command.create_importer(options)
+                importer.import_data()
+            total = importer.stats.get_total()
+            for name in ('rows_read', 'rows_written', 'rows_unchanged', 'rows_skipped'):
+                result[name] = getattr(total, name)
+        except ImportLocked as e:
+            logger.warning(str(e))
+            result['status'] = 'locked'
+        except Exception as e:
+            logger.exception('Importing %s failed' % identifier)
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        finally:
+            # Every thread has connections of its own
+            connections.close_all()
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    def write_summary(self, results):
+        rows = [[title for name, title, format in COLUMNS]]
+        rows += [[format % result[name] if name in result else '-' for name, title, format in COLUMNS]
+                 for result in results]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+        for row in rows:
+            self.stdout.write('  '.join([row[0].ljust(widths[0]), row[1].ljust(widths[1])] +
+                                        [cell.rjust(width) for cell, width in zip(row[2:], widths[2:])]))
+        for result in results:
+            if 'error' in result:
+                self.stdout.write('%s: %s' % (result['source'], result['error']))
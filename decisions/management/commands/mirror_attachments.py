@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from decisions.importer.mirror import AttachmentFetcher, ContentStore
+from decisions.models import Attachment
+
+
+class Command(BaseCommand):
+    help = 'Fetches the contents of attachments into local content-addressed storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-source', type=str, dest='data_source', default=None,
+                            help='Only fetch the attachments of the data source with this identifier')
+        parser.add_argument('--workers', type=int, dest='workers', default=8,
+                            help='Number of attachments fetched at the same time')
+        parser.add_argument('--per-host', type=int, dest='per_host', default=4,
+                            help='Number of attachments fetched from one host at the same time')
+        parser.add_argument('--retries', type=int, dest='retries', default=3,
+                            help='Number of times a failed request is retried')
+        parser.add_argument('--timeout', type=float, dest='timeout', default=30,
+                            help='Seconds to wait for a server to respond')
+
+    def handle(self, *args, **options):
+        queryset = Attachment.objects.filter(public=True)
+        if options['data_source']:
+            queryset = queryset.filter(data_source__identifier=options['data_source'])
+
+        fetcher = AttachmentFetcher(ContentStore(), workers=options['workers'], per_host=options['per_host'],
+                                    retries=options['retries'], timeout=options['timeout'])
+        counts = fetcher.mirror(queryset)
+        self.stdout.write('%d stored, %d unchanged, %d not modified, %d failed' % (
+            counts['stored'], counts['unchanged'], counts['not modified'], counts['failed']))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from decisions.models import Action, Case, DataSource
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the full-text search vectors of all cases and actions'
+
+    def handle(self, *args, **options):
+        changed = False
+        for model in (Case, Action):
+            count = model.refresh_search_vectors()
+            self.stdout.write('%s: %d search vectors updated' % (model.__name__, count))
+            changed = changed or count > 0
+        # Search results of every data source may have changed, the cached API responses are stale
+        if changed:
+            DataSource.bump_generations(DataSource.objects.values_list('pk', flat=True))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0002_organization_class'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='attachment',
+            unique_together=set([('data_source', 'origin_id')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='casegeometry',
+            unique_together=set([('data_source', 'origin_id'), ('name', 'type')]),
+        ),
+    ]
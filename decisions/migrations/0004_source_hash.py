@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 12:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0003_data_source_origin_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='action',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='case',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='casegeometry',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the source data the resource was last imported from', max_length=40, null=True),
+        ),
+    ]
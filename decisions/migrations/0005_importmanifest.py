@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 13:55
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0004_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportManifest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='The time at which the resource was created')),
+                ('modified_at', models.DateTimeField(auto_now=True, help_text='The time at which the resource was updated')),
+                ('members', django.contrib.postgres.fields.jsonb.JSONField(default=dict, help_text='CRC and size of every member of the last successfully imported archive, by member path')),
+                ('data_source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='import_manifest', to='decisions.DataSource')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 15:12
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0005_importmanifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='The time at which the resource was created')),
+                ('modified_at', models.DateTimeField(auto_now=True, help_text='The time at which the resource was updated')),
+                ('source', models.CharField(help_text='Path of the imported file', max_length=1000)),
+                ('fingerprint', models.CharField(help_text='Size and modification time of the imported file', max_length=100)),
+                ('completed_stages', django.contrib.postgres.fields.jsonb.JSONField(default=list, help_text='Names of the import stages completed')),
+                ('stage', models.CharField(blank=True, help_text='Name of the import stage in progress', max_length=100)),
+                ('position', models.PositiveIntegerField(default=0, help_text='Number of records of the stage in progress committed')),
+                ('data_source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_checkpoints', to='decisions.DataSource')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='importcheckpoint',
+            unique_together=set([('data_source', 'source')]),
+        ),
+    ]
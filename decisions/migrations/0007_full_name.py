@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 15:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+UPDATE_TREE_SQL = '''
+WITH RECURSIVE tree (id, full_name, depth) AS (
+    SELECT id, CAST(name AS text), 0 FROM {table} WHERE parent_id IS NULL
+  UNION ALL
+    SELECT child.id, tree.full_name || ' / ' || child.name, tree.depth + 1
+    FROM {table} child JOIN tree ON child.parent_id = tree.id
+    WHERE tree.depth < 50
+)
+UPDATE {table} SET full_name = tree.full_name, depth = tree.depth
+FROM tree
+WHERE {table}.id = tree.id
+'''
+
+UPDATE_POSTS_SQL = '''
+UPDATE decisions_post SET full_name = o.full_name || ' / ' || decisions_post.label
+FROM decisions_organization o
+WHERE decisions_post.organization_id = o.id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0006_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Number of ancestors'),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='full_name',
+            field=models.TextField(blank=True, editable=False, help_text='Names of the ancestors and this, separated by slashes'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Number of ancestors'),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='full_name',
+            field=models.TextField(blank=True, editable=False, help_text='Names of the ancestors and this, separated by slashes'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='full_name',
+            field=models.TextField(blank=True, editable=False, help_text='Full name of the organization and the label of this post'),
+        ),
+        migrations.RunSQL(UPDATE_TREE_SQL.format(table='decisions_organization'), migrations.RunSQL.noop),
+        migrations.RunSQL(UPDATE_TREE_SQL.format(table='decisions_function'), migrations.RunSQL.noop),
+        migrations.RunSQL(UPDATE_POSTS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 16:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0007_full_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='SHA-256 hash of the content', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='etag',
+            field=models.CharField(blank=True, editable=False, help_text='ETag of the content when it was fetched', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='fetched_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='The time at which the content was last checked', null=True),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='fetched_url',
+            field=models.URLField(blank=True, editable=False, help_text='URL the local copy was fetched from'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(blank=True, editable=False, help_text='Local copy of the content, stored under the SHA-256 hash of the content', upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='last_modified',
+            field=models.CharField(blank=True, editable=False, help_text='Last-Modified header of the content when it was fetched', max_length=64),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 16:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0009_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='function',
+            index=models.Index(fields=['modified_at', 'id'], name='decisions_function_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['modified_at', 'id'], name='decisions_case_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['modified_at', 'id'], name='decisions_action_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['modified_at', 'id'], name='decisions_event_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['start_date', 'id'], name='decisions_event_start_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(fields=['modified_at', 'id'], name='decisions_organization_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['modified_at', 'id'], name='decisions_post_keyset'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.3 on 2026-10-18 17:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='generation',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Incremented whenever an import commits changes, invalidating the cached API responses'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from .base import DataSource  # noqa
 from .case import Action, Attachment, Case, CaseGeometry, Content, Function  # noqa
+from .importer import ImportCheckpoint, ImportManifest  # noqa
 from .meeting import Event  # noqa
 from .organization import OrganizationClass, Organization, Post  # noqa
 from .person import Membership, Person  # noqa
@@ -1,6 +1,6 @@
 # -*- coding: UTF-8 -*-
 
-from django.db import models
+from django.db import connection, models
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -17,15 +17,99 @@ class BaseModel(models.Model):
 class DataSource(BaseModel):
     identifier = models.CharField(max_length=255, unique=True, db_index=True)
     name = models.CharField(max_length=255, help_text=_('Human-readable name'))
+    generation = models.PositiveIntegerField(default=0, editable=False, help_text=_(
+        'Incremented whenever an import commits changes, invalidating the cached API responses'))
 
     def __str__(self):
         return self.identifier
 
+    @classmethod
+    def bump_generations(cls, pks):
+        """
+        Increment the generations of the data sources with the given pks.
+        """
+        return cls.objects.filter(pk__in=pks).update(generation=models.F('generation') + 1)
+
 
 class DataModel(BaseModel):
     data_source = models.ForeignKey(DataSource, blank=True, null=True, db_index=True)
     origin_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    source_hash = models.CharField(max_length=40, blank=True, null=True, editable=False,
+                                   help_text=_('Hash of the source data the resource was last imported from'))
 
     class Meta:
         abstract = True
         unique_together = ('data_source', 'origin_id')
+
+
+# Depth at which the full names stop being computed, deeper objects are assumed to be in a parent cycle
+MAX_HIERARCHY_DEPTH = 50
+
+UPDATE_TREE_SQL = '''
+WITH RECURSIVE tree (id, full_name, depth) AS (
+    {anchor}
+  UNION ALL
+    SELECT child.{pk}, tree.full_name || ' / ' || child.{name}, tree.depth + 1
+    FROM {table} child JOIN tree ON child.{parent} = tree.id
+    WHERE tree.depth < %s
+)
+UPDATE {table} SET full_name = tree.full_name, depth = tree.depth, modified_at = now()
+FROM tree
+WHERE {table}.{pk} = tree.id AND ({table}.full_name <> tree.full_name OR {table}.depth <> tree.depth)
+'''
+
+
+class HierarchicalModel(DataModel):
+    """
+    A data model forming a tree through its `parent` field, storing its full name and depth in the tree.
+
+    Saving an object updates the stored values of it and its descendants.
+    Objects written in bulk should be followed by `rebuild_hierarchy`.
+    """
+    full_name = models.TextField(blank=True, editable=False, help_text=_(
+        'Names of the ancestors and this, separated by slashes'))
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, help_text=_('Number of ancestors'))
+
+    class Meta(DataModel.Meta):
+        abstract = True
+
+    def __str__(self):
+        return self.full_name or self.name
+
+    def save(self, *args, **kwargs):
+        old = (self.full_name, self.depth)
+        if self.parent_id is None:
+            self.full_name, self.depth = self.name, 0
+        else:
+            parent_name, parent_depth = type(self).objects.values_list('full_name', 'depth').get(pk=self.parent_id)
+            self.full_name, self.depth = '%s / %s' % (parent_name, self.name), parent_depth + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'full_name', 'depth'}
+        super().save(*args, **kwargs)
+        if (self.full_name, self.depth) != old:
+            self.update_descendants()
+
+    def update_descendants(self):
+        return self._update_tree('SELECT {pk}, CAST(%s || \' / \' || {name} AS text), %s FROM {table} '
+                                 'WHERE {parent} = %s', [self.full_name, self.depth + 1, self.pk])
+
+    @classmethod
+    def rebuild_hierarchy(cls):
+        """
+        Recompute the full names and depths of all objects, returning the number of objects changed.
+        """
+        return cls._update_tree('SELECT {pk}, CAST({name} AS text), 0 FROM {table} WHERE {parent} IS NULL', [])
+
+    @classmethod
+    def _update_tree(cls, anchor, params):
+        quote = connection.ops.quote_name
+        names = dict(
+            table=quote(cls._meta.db_table),
+            pk=quote(cls._meta.pk.column),
+            name=quote(cls._meta.get_field('name').column),
+            parent=quote(cls._meta.get_field('parent').column),
+        )
+        sql = UPDATE_TREE_SQL.format(anchor=anchor.format(**names), **names)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [MAX_HIERARCHY_DEPTH])
+            return cursor.rowcount
@@ -1,17 +1,53 @@
 # -*- coding: UTF-8 -*-
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection
 from django.utils.translation import ugettext_lazy as _
 
-from .base import DataModel
+from .base import DataModel, HierarchicalModel
 
+# Text search configurations every searchable text is indexed with
+SEARCH_CONFIGS = ('finnish', 'swedish')
 
-class Function(DataModel):
+# Longer texts are cut to keep the vectors within the size limit of tsvectors
+MAX_SEARCH_TEXT_LENGTH = 100000
+
+REFRESH_CASES_SQL = '''
+UPDATE {case} SET search_vector = {title} || setweight(to_tsvector('simple', register_id), 'A')
+WHERE {condition}
+'''
+
+REFRESH_ACTIONS_SQL = '''
+UPDATE {action} SET search_vector = v.search_vector
+FROM (
+    SELECT a.id, {title} || {contents} AS search_vector
+    FROM {action} a LEFT JOIN {content} c ON c.action_id = a.id
+    WHERE {condition}
+    GROUP BY a.id
+) v
+WHERE {action}.id = v.id
+'''
+
+
+def get_search_vector_sql(text, weight):
+    vectors = ' || '.join("to_tsvector('%s', %s)" % (config, text) for config in SEARCH_CONFIGS)
+    return "setweight(%s, '%s')" % (vectors, weight)
+
+
+def execute_search_vector_refresh(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+class Function(HierarchicalModel):
     name = models.CharField(max_length=255, help_text=_('Name of this function'))
     function_id = models.CharField(max_length=32, help_text=_('Original identifier of this function'))
     parent = models.ForeignKey('self', help_text=_('Parent function of this function'), blank=True, null=True)
 
-    def __str__(self):
-        return '%s / %s' % (self.parent, self.name) if self.parent else self.name
+    class Meta(HierarchicalModel.Meta):
+        indexes = [models.Index(fields=['modified_at', 'id'], name='decisions_function_keyset')]
 
 
 class CaseGeometry(DataModel):
@@ -31,8 +67,8 @@ class CaseGeometry(DataModel):
     def __str__(self):
         return '%s (%s, %s)' % (self.name, self.type, self.geometry.geom_type)
 
-    class Meta:
-        unique_together = (('name', 'type'),)
+    class Meta(DataModel.Meta):
+        unique_together = (('name', 'type'), ('data_source', 'origin_id'))
 
 
 class Case(DataModel):
@@ -44,10 +80,33 @@ class Case(DataModel):
                                  help_text=_('Function this case belongs to ("tehtäväluokka")'))
     geometries = models.ManyToManyField(CaseGeometry, related_name='cases', blank=True,
                                         help_text=_('Geometries related to this case'))
+    search_vector = SearchVectorField(null=True, editable=False, help_text=_(
+        'Full-text search vector of the title and register ID'))
+
+    class Meta(DataModel.Meta):
+        indexes = [
+            GinIndex(fields=['search_vector'], name='decisions_case_search_gin'),
+            models.Index(fields=['modified_at', 'id'], name='decisions_case_keyset'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def refresh_search_vectors(cls, since=None):
+        """
+        Recompute the search vectors of all cases or those changed since the given time.
+
+        Returns the number of cases updated. Cases without a vector are
+        always included.
+        """
+        condition, params = 'TRUE', []
+        if since is not None:
+            condition, params = 'search_vector IS NULL OR modified_at >= %s', [since]
+        sql = REFRESH_CASES_SQL.format(case=connection.ops.quote_name(cls._meta.db_table), condition=condition,
+                                       title=get_search_vector_sql('title', 'A'))
+        return execute_search_vector_refresh(sql, params)
+
 
 class Action(DataModel):
     title = models.CharField(max_length=255,
@@ -63,10 +122,44 @@ class Action(DataModel):
         'If this decision was delegated, this field will be filled and refers to the post that made the decision'))
     event = models.ForeignKey('Event', related_name='actions', help_text=_('Event this action is related to'),
                               null=True, blank=True)
+    search_vector = SearchVectorField(null=True, editable=False, help_text=_(
+        'Full-text search vector of the title and contents'))
+
+    class Meta(DataModel.Meta):
+        indexes = [
+            GinIndex(fields=['search_vector'], name='decisions_action_search_gin'),
+            models.Index(fields=['modified_at', 'id'], name='decisions_action_keyset'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def refresh_search_vectors(cls, since=None):
+        """
+        Recompute the search vectors of all actions or those changed since the given time.
+
+        An action has changed if it or any of its contents has. Returns the
+        number of actions updated. Actions without a vector are always
+        included.
+        """
+        quote = connection.ops.quote_name
+        condition, params = 'TRUE', []
+        if since is not None:
+            condition = ('a.search_vector IS NULL OR a.modified_at >= %s OR EXISTS (SELECT 1 FROM {content} changed '
+                         'WHERE changed.action_id = a.id AND changed.modified_at >= %s)')
+            params = [since, since]
+        contents = "left(coalesce(string_agg(c.title || ' ' || c.hypertext, ' ' ORDER BY c.ordering), ''), %d)" % (
+            MAX_SEARCH_TEXT_LENGTH)
+        names = dict(action=quote(cls._meta.db_table), content=quote(Content._meta.db_table))
+        sql = REFRESH_ACTIONS_SQL.format(
+            condition=condition.format(**names),
+            title=get_search_vector_sql('a.title', 'A'),
+            contents=get_search_vector_sql(contents, 'B'),
+            **names
+        )
+        return execute_search_vector_refresh(sql, params)
+
 
 class Content(DataModel):
     ordering = models.IntegerField(help_text=_('Ordering of this content within the larger context (like action)'))
@@ -84,7 +177,6 @@ class Content(DataModel):
 
 
 class Attachment(DataModel):
-    # file = models.FileField()  # TODO
     name = models.CharField(max_length=400, blank=True, help_text='Short name of this attachment')
     url = models.URLField(help_text=_('URL of the content of this attachment'))
     action = models.ForeignKey(Action, help_text=_('The action this attachment is related to'),
@@ -93,9 +185,20 @@ class Attachment(DataModel):
     public = models.BooleanField(default=False, help_text=_('Is this attachment public?'))
     confidentiality_reason = models.CharField(max_length=100, help_text=_(
         'Reason for keeping this attachment confidential'), blank=True)
+    file = models.FileField(blank=True, editable=False, help_text=_(
+        'Local copy of the content, stored under the SHA-256 hash of the content'))
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False, help_text=_(
+        'SHA-256 hash of the content'))
+    fetched_url = models.URLField(blank=True, editable=False, help_text=_('URL the local copy was fetched from'))
+    etag = models.CharField(max_length=255, blank=True, editable=False, help_text=_(
+        'ETag of the content when it was fetched'))
+    last_modified = models.CharField(max_length=64, blank=True, editable=False, help_text=_(
+        'Last-Modified header of the content when it was fetched'))
+    fetched_at = models.DateTimeField(null=True, blank=True, editable=False, help_text=_(
+        'The time at which the content was last checked'))
 
     def __str__(self):
         return '%s %s' % (self.name, self.action)
 
-    class Meta:
+    class Meta(DataModel.Meta):
         ordering = ('number',)
@@ -0,0 +1,32 @@
+# -*- coding: UTF-8 -*-
+
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from .base import BaseModel, DataSource
+
+
+class ImportManifest(BaseModel):
+    data_source = models.OneToOneField(DataSource, related_name='import_manifest', on_delete=models.CASCADE)
+    members = JSONField(default=dict, help_text=_(
+        'CRC and size of every member of the last successfully imported archive, by member path'))
+
+    def __str__(self):
+        return 'Import manifest of %s' % self.data_source
+
+
+class ImportCheckpoint(BaseModel):
+    data_source = models.ForeignKey(DataSource, related_name='import_checkpoints', on_delete=models.CASCADE)
+    source = models.CharField(max_length=1000, help_text=_('Path of the imported file'))
+    fingerprint = models.CharField(max_length=100, help_text=_('Size and modification time of the imported file'))
+    completed_stages = JSONField(default=list, help_text=_('Names of the import stages completed'))
+    stage = models.CharField(max_length=100, blank=True, help_text=_('Name of the import stage in progress'))
+    position = models.PositiveIntegerField(default=0, help_text=_(
+        'Number of records of the stage in progress committed'))
+
+    class Meta:
+        unique_together = (('data_source', 'source'),)
+
+    def __str__(self):
+        return 'Import checkpoint of %s in %s' % (self.source, self.data_source)
@@ -16,5 +16,11 @@ class Event(DataModel):
     start_date = models.DateField(help_text=_('The time at which the event starts'))
     end_date = models.DateField(help_text=_('The time at which the event ends'), blank=True, null=True)
 
+    class Meta(DataModel.Meta):
+        indexes = [
+            models.Index(fields=['modified_at', 'id'], name='decisions_event_keyset'),
+            models.Index(fields=['start_date', 'id'], name='decisions_event_start_keyset'),
+        ]
+
     def __str__(self):
         return '%s %s' % (self.start_date, self.organization)
@@ -1,16 +1,34 @@
 # -*- coding: UTF-8 -*-
 
-from django.db import models
+from django.db import connection, models
 from django.utils.translation import ugettext_lazy as _
 
-from .base import DataModel
+from .base import DataModel, HierarchicalModel, MAX_HIERARCHY_DEPTH
+
+UPDATE_POSTS_SQL = '''
+UPDATE {post} SET full_name = o.full_name || ' / ' || {post}.label, modified_at = now()
+FROM {organization} o
+WHERE {post}.organization_id = o.id AND {post}.full_name <> o.full_name || ' / ' || {post}.label
+'''
+
+# Limits UPDATE_POSTS_SQL to the posts of an organization and its descendants
+SUBTREE_POSTS_SQL = '''
+WITH RECURSIVE subtree (id, depth) AS (
+    SELECT %s, 0
+  UNION ALL
+    SELECT child.id, subtree.depth + 1
+    FROM {organization} child JOIN subtree ON child.parent_id = subtree.id
+    WHERE subtree.depth < %s
+)
+''' + UPDATE_POSTS_SQL + '''AND {post}.organization_id IN (SELECT id FROM subtree)
+'''
 
 
 class OrganizationClass(models.Model):
     name = models.CharField(max_length=255, null=True)
 
 
-class Organization(DataModel):
+class Organization(HierarchicalModel):
     classification = models.ForeignKey(
         OrganizationClass,
         help_text=_('An organization category, e.g. committee'),
@@ -22,11 +40,20 @@ class Organization(DataModel):
     parent = models.ForeignKey('self', help_text=_('The organizations that contain this organization'), null=True,
                                blank=True)
 
-    def __str__(self):
-        if self.parent:
-            return '%s / %s' % (self.parent, self.name)  # TODO cache
-        else:
-            return self.name
+    class Meta(HierarchicalModel.Meta):
+        indexes = [models.Index(fields=['modified_at', 'id'], name='decisions_organization_keyset')]
+
+    # Posts of an organization are named after it
+    def update_descendants(self):
+        count = super().update_descendants()
+        Post.rebuild_full_names(self)
+        return count
+
+    @classmethod
+    def rebuild_hierarchy(cls):
+        count = super().rebuild_hierarchy()
+        Post.rebuild_full_names()
+        return count
 
 
 class Post(DataModel):
@@ -35,6 +62,35 @@ class Post(DataModel):
                                      help_text=_('The organization in which the post is held'))
     start_date = models.DateField(help_text=_('The date on which the post was created'), null=True, blank=True)
     end_date = models.DateField(help_text=_('The date on which the post was eliminated'), null=True, blank=True)
+    full_name = models.TextField(blank=True, editable=False, help_text=_(
+        'Full name of the organization and the label of this post'))
+
+    class Meta(DataModel.Meta):
+        indexes = [models.Index(fields=['modified_at', 'id'], name='decisions_post_keyset')]
 
     def __str__(self):
-        return '%s / %s' % (self.organization, self.label)  # TODO cache
+        return self.full_name or self.label
+
+    def save(self, *args, **kwargs):
+        organization_name = Organization.objects.values_list('full_name', flat=True).get(pk=self.organization_id)
+        self.full_name = '%s / %s' % (organization_name, self.label)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'full_name'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def rebuild_full_names(cls, organization=None):
+        """
+        Recompute the full names of posts from their organizations, returning the number of posts changed.
+
+        Only the posts of organization and its descendants are recomputed if given, otherwise all of them.
+        """
+        sql, params = UPDATE_POSTS_SQL, []
+        if organization is not None:
+            sql, params = SUBTREE_POSTS_SQL, [organization.pk, MAX_HIERARCHY_DEPTH]
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(
+                post=connection.ops.quote_name(cls._meta.db_table),
+                organization=connection.ops.quote_name(Organization._meta.db_table),
+            ), params)
+            return cursor.rowcount
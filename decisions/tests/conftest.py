@@ -1,3 +1,4 @@
+import pytest
 from pytest_factoryboy import register
 
 from decisions.factories import (
@@ -12,3 +13,11 @@ register(EventFactory)
 register(OrganizationClassFactory)
 register(OrganizationFactory)
 register(PostFactory)
+
+
+@pytest.fixture(autouse=True)
+def api_cache(settings):
+    """
+    Disable the API response cache, which only imports invalidate, for tests writing objects directly.
+    """
+    settings.CACHES = dict(settings.CACHES, api={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
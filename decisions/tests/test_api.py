@@ -1,6 +1,10 @@
+from datetime import date
+
 import pytest
 from rest_framework.reverse import reverse
 
+from decisions.models import Action, DataSource
+
 
 @pytest.mark.parametrize('resource', [
     'action',
@@ -24,3 +28,136 @@ def test_smoke_get(client, resource, action, case, function, event, organization
     response = client.get(detail_url)
     assert response.status_code == 200
     assert response.data
+
+
+@pytest.mark.django_db
+def test_full_text_search(client, action_factory):
+    """
+    Test that searching finds actions by their title and contents, best matches first.
+    """
+    in_contents = action_factory(title='Asemakaavan muutos')
+    in_contents.contents.create(ordering=1, type='proposal', hypertext='<p>Uusi puisto rakennetaan.</p>')
+    in_title = action_factory(title='Puisto Kallioon')
+    action_factory(title='Talousarvio')
+    Action.refresh_search_vectors()
+
+    response = client.get(reverse('v1:action-list'), {'search': 'puisto'})
+
+    assert response.status_code == 200
+    assert [result['id'] for result in response.data['results']] == [in_title.id, in_contents.id]
+
+
+@pytest.mark.django_db
+def test_keyset_pagination(client, event_factory):
+    """
+    Test that cursor pages walk through all objects in order, forwards and backwards.
+    """
+    events = [event_factory(start_date=date(2017, 1, day % 3 + 1)) for day in range(5)]
+    expected = [event.id for event in sorted(events, key=lambda event: (event.start_date, event.id))]
+
+    response = client.get(reverse('v1:event-list'), {'pagination': 'cursor', 'limit': 2})
+    ids = []
+    pages = []
+    while True:
+        assert 'count' not in response.data
+        ids += [result['id'] for result in response.data['results']]
+        pages.append(response)
+        if not response.data['next']:
+            break
+        response = client.get(response.data['next'])
+    assert ids == expected
+    assert len(pages) == 3
+
+    response = client.get(pages[-1].data['previous'])
+    assert [result['id'] for result in response.data['results']] == expected[2:4]
+    assert client.get(reverse('v1:event-list'), {'cursor': 'garbage'}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_estimated_count(client, settings, action_factory):
+    """
+    Test that large result sets get an estimated count unless an exact one is asked for.
+    """
+    action_factory.create_batch(3)
+    url = reverse('v1:action-list')
+
+    response = client.get(url)
+    assert (response.data['count'], response.data['count_estimated']) == (3, False)
+
+    settings.API_ESTIMATED_COUNT_THRESHOLD = 1
+    response = client.get(url)
+    assert response.data['count_estimated']
+    assert len(response.data['results']) == 3
+
+    response = client.get(url, {'count': 'exact'})
+    assert (response.data['count'], response.data['count_estimated']) == (3, False)
+
+
+@pytest.mark.django_db
+def test_conditional_get(client, event, action_factory):
+    """
+    Test that unchanged lists and objects are answered with 304 until they or their related objects change.
+    """
+    for url in (reverse('v1:event-list'), reverse('v1:event-detail', kwargs={'pk': event.id})):
+        response = client.get(url)
+        assert response.status_code == 200
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        assert client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+        action_factory(event=event)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    # Changes not raising any modification time, e.g. deleted related objects, bump the generations
+    url = reverse('v1:event-detail', kwargs={'pk': event.id})
+    etag = client.get(url)['ETag']
+    data_source = DataSource.objects.create(identifier='test', name='Test')
+    DataSource.bump_generations([data_source.pk])
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_response_cache(client, settings, event_factory):
+    """
+    Test that responses are cached until the generation of a data source is bumped.
+    """
+    settings.CACHES = dict(settings.CACHES, api={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                  'LOCATION': 'test_response_cache'})
+    data_source = DataSource.objects.create(identifier='test', name='Test')
+    event_factory(data_source=data_source)
+    url = reverse('v1:event-list')
+
+    response = client.get(url)
+    assert response.data['count'] == 1
+    etag = response['ETag']
+
+    event_factory(data_source=data_source)
+    response = client.get(url)
+    assert (response.data['count'], response['ETag']) == (1, etag)
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    DataSource.bump_generations([data_source.pk])
+    response = client.get(url)
+    assert response.data['count'] == 2
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_large_responses_not_cached(client, settings, event_factory):
+    """
+    Test that responses larger than API_MAX_CACHED_RESPONSE_SIZE are built again every time.
+    """
+    settings.CACHES = dict(settings.CACHES, api={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                  'LOCATION': 'test_large_responses_not_cached'})
+    settings.API_MAX_CACHED_RESPONSE_SIZE = 1
+    event_factory()
+    url = reverse('v1:event-list')
+
+    assert client.get(url).data['count'] == 1
+    event_factory()
+    assert client.get(url).data['count'] == 2
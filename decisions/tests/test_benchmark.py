@@ -0,0 +1,43 @@
+import json
+import logging
+from collections import Counter
+
+from decisions.importer.archive import ZipArchive
+from decisions.importer.benchmark import generate_open_ahjo, generate_scraper_archive, Scale
+from decisions.importer.paatos_scraper import PaatosScraperParser
+
+SCALE = Scale(organizations=2, meetings=3, agenda_items=4, content_sections=2, attachments=1, geometries=5)
+
+
+def test_generate_open_ahjo(tmpdir):
+    """
+    Test that the generated Open Ahjo dump has the requested amount of data.
+    """
+    path = str(tmpdir.join('open_ahjo.json'))
+    generate_open_ahjo(path, SCALE)
+    with open(path, encoding='utf-8') as data_file:
+        data = json.load(data_file)
+
+    # every organization has a committee and an office holder policymaker
+    assert len(data['meetings']) == 2 * 2 * 3
+    assert len(data['agenda_items']) == 2 * 2 * 3 * 4
+    assert len(data['content_sections']) == 2 * len(data['agenda_items'])
+    assert len(data['issue_geometries']) == 5
+    issues = {issue['id'] for issue in data['issues']}
+    assert all(item['issue'] in issues for item in data['agenda_items'] if item['issue'])
+
+
+def test_generate_scraper_archive(tmpdir):
+    """
+    Test that the generated scraper archive can be parsed.
+    """
+    path = str(tmpdir.join('scraper.zip'))
+    generate_scraper_archive(path, SCALE)
+
+    with ZipArchive(path) as archive:
+        parser = PaatosScraperParser(archive, logging.getLogger(__name__))
+        counts = Counter(model.__name__ for unit in parser.iter_units() for model, origin_id, values in
+                         parser.parse_unit(unit))
+
+    assert counts == {'Organization': 2, 'Case': 2 * 6, 'Event': 2 * 3, 'Action': 2 * 3 * 4,
+                      'Content': 2 * 3 * 4 * 2, 'Attachment': 2 * 3 * 4}
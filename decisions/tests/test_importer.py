@@ -0,0 +1,306 @@
+import copy
+import json
+import logging
+import zipfile
+
+import pytest
+from django.db import connection
+
+from decisions.importer.flush import flush_data_source
+from decisions.importer.helsinki import HelsinkiImporter
+from decisions.importer.locks import data_source_lock, ImportLocked
+from decisions.importer.open_ahjo import OpenAhjoImporter
+from decisions.importer.paatos_scraper import PaatosScraperImporter
+from decisions.models import (
+    Action, Attachment, Case, CaseGeometry, Content, DataSource, Event, Function, ImportCheckpoint, ImportManifest,
+    Organization, OrganizationClass
+)
+
+
+def make_org(org_id, *parents):
+    return {'id': org_id, 'name_fin': 'Org %s' % org_id, 'parents': list(parents)}
+
+
+@pytest.mark.django_db
+def test_helsinki_organization_levels():
+    """
+    Test that organizations are ordered parents first and that cycles and missing parents do not hang.
+    """
+    org_list = [
+        make_org('child', 'middle'),
+        make_org('middle', 'root'),
+        make_org('root'),
+        make_org('orphan', 'missing'),
+        make_org('cycle-a', 'cycle-b'),
+        make_org('cycle-b', 'cycle-a'),
+        make_org('below-cycle', 'cycle-a'),
+    ]
+    original = copy.deepcopy(org_list)
+
+    importer = HelsinkiImporter({'verbosity': 1})
+    levels = importer._order_organizations(org_list)
+
+    assert [[org['id'] for org in level] for level in levels] == [['root', 'orphan'], ['middle'], ['child']]
+    assert org_list == original
+
+
+def make_open_ahjo_data(organization_origin_id):
+    return {
+        'organizations': [{'origin_id': organization_origin_id, 'type': 'council'}],
+        'policymakers': [{'id': 1, 'origin_id': organization_origin_id}],
+        'meetings': [{'id': 10, 'policymaker': 1, 'date': '2017-01-30'}],
+        'categories': [{'id': 'c1', 'origin_id': '00 00', 'name': 'Hallinto', 'parent': None}],
+        'issue_geometries': [],
+        'issues': [{'id': 'i1', 'subject': 'Asia', 'register_id': 'HEL 2017-000001', 'category': 'c1',
+                    'geometries': []}],
+        'agenda_items': [
+            {'id': 'a1', 'meeting': 10, 'subject': 'Asia 1', 'index': 1, 'resolution': 'PASSED', 'issue': 'i1'},
+            {'id': 'a2', 'meeting': 10, 'subject': 'Asia 2', 'index': 2, 'resolution': None, 'issue': None},
+        ],
+        'content_sections': [
+            {'id': 's1', 'agenda_item': 'a1', 'type': 'resolution', 'index': 0, 'text': '<p>a\tb\nc\\d</p>'},
+            {'id': 's2', 'agenda_item': 'missing', 'type': 'resolution', 'index': 0, 'text': ''},
+        ],
+        'attachments': [
+            {'id': 't1', 'agenda_item': 'a1', 'name': None, 'url': None, 'number': 1, 'public': True,
+             'confidentiality_reason': None},
+        ],
+    }
+
+
+def get_imported_rows(model, *references):
+    fields = ['origin_id', 'source_hash'] + [f.name for f in model._meta.concrete_fields
+                                             if f.name not in ('id', 'created_at', 'modified_at') and not f.is_relation]
+    return sorted(model.objects.values_list(*(fields + ['%s__origin_id' % name for name in references])))
+
+
+@pytest.mark.django_db
+def test_open_ahjo_fast_load(tmpdir, organization):
+    """
+    Test that loading through staging tables gives the same objects as the normal import.
+    """
+    organization.origin_id = 'org1'
+    organization.save()
+    path = tmpdir.join('dump.json')
+    path.write(json.dumps(make_open_ahjo_data('org1')))
+
+    def import_open_ahjo(fast_load):
+        options = {'verbosity': 1, 'filename': str(path), 'flush': False, 'fast_load': fast_load}
+        importer = OpenAhjoImporter(options)
+        importer.import_data()
+        return importer
+
+    def get_rows():
+        return (get_imported_rows(Action, 'case', 'post', 'event'), get_imported_rows(Content, 'action'),
+                get_imported_rows(Attachment, 'action'))
+
+    import_open_ahjo(False)
+    expected = get_rows()
+    assert [len(rows) for rows in expected] == [2, 1, 1]
+
+    Action.objects.all().delete()
+    import_open_ahjo(True)
+    assert get_rows() == expected
+
+    importer = import_open_ahjo(True)
+    assert importer.get_upserter(Action).unchanged == 2
+    assert importer.get_upserter(Content).skipped == 1
+
+
+@pytest.mark.django_db
+def test_flush_data_source(action_factory):
+    """
+    Test that flushing deletes the objects of one data source and what refers to them, but nothing else.
+    """
+    kept_source = DataSource.objects.create(identifier='kept', name='Kept')
+    flushed_source = DataSource.objects.create(identifier='flushed', name='Flushed')
+    kept = action_factory(data_source=kept_source)
+    flushed = action_factory(data_source=flushed_source)
+    Function.objects.filter(pk=flushed.case.function_id).update(data_source=flushed_source)
+    kept_child = Function.objects.create(data_source=kept_source, name='Child', parent_id=flushed.case.function_id)
+
+    flush_data_source(flushed_source, (Function, Event, CaseGeometry, Action, Content, Attachment),
+                      logging.getLogger(__name__))
+
+    assert list(Action.objects.all()) == [kept]
+    kept_child.refresh_from_db()
+    assert kept_child.parent is None
+    assert list(Case.objects.all()) == [kept.case]
+    assert Event.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_run_in_batches_skips_failing_records():
+    """
+    Test that records failing in the database or with invalid values are skipped without losing their batch.
+    """
+    importer = OpenAhjoImporter({'verbosity': 1, 'batch_size': 10})
+
+    def handle(record):
+        if record == 'broken':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT * FROM missing_table')
+        elif record == 'invalid date':
+            importer.save_organization({
+                'origin_id': 'o1', 'name': 'Org', 'classification': None, 'parent': None,
+                'founding_date': None, 'dissolution_date': None,
+                'memberships': [{'person': {'origin_id': 'p1', 'name': 'Person'}, 'role': 'member',
+                                 'start_date': 'yesterday', 'end_date': None}],
+            })
+        else:
+            importer.upsert(Function, record, {'name': record})
+
+    importer.run_in_batches(['f1', 'broken', 'invalid date', 'f2'], handle)
+
+    assert sorted(Function.objects.values_list('origin_id', flat=True)) == ['f1', 'f2']
+    assert not Organization.objects.exists()
+
+
+@pytest.mark.django_db
+def test_set_m2m(action):
+    """
+    Test that many-to-many relations are synchronised keeping the rows that did not change.
+
+    Cases whose relations changed get a new modification time.
+    """
+    importer = OpenAhjoImporter({'verbosity': 1})
+    case = action.case
+    Case.objects.filter(pk=case.pk).update(data_source=importer.data_source, origin_id='c1')
+    for number in range(1, 4):
+        Attachment.objects.create(data_source=importer.data_source, origin_id='t%d' % number, action=action,
+                                  url='http://example.com/%d.pdf' % number, number=number)
+    through = Case.attachments.through
+
+    importer.set_m2m(Case, 'attachments', 'c1', ['t1', 't2', 'missing'])
+    importer.flush_batch()
+    kept_pk = through.objects.get(attachment__origin_id='t2').pk
+
+    modified_at = Case.objects.get(pk=case.pk).modified_at
+
+    importer.set_m2m(Case, 'attachments', 'c1', ['t2', 't3'])
+    importer.flush_batch()
+
+    assert sorted(case.attachments.values_list('origin_id', flat=True)) == ['t2', 't3']
+    assert through.objects.get(attachment__origin_id='t2').pk == kept_pk
+    assert Case.objects.get(pk=case.pk).modified_at > modified_at
+
+    modified_at = Case.objects.get(pk=case.pk).modified_at
+    importer.set_m2m(Case, 'attachments', 'c1', ['t3', 't2'])
+    importer.flush_batch()
+    assert Case.objects.get(pk=case.pk).modified_at == modified_at
+
+
+@pytest.mark.django_db
+def test_open_ahjo_validate_only(tmpdir, organization):
+    """
+    Test that validation reports duplicates and dangling references without writing anything.
+    """
+    organization.origin_id = 'org1'
+    organization.save()
+    data = make_open_ahjo_data('org1')
+    data['agenda_items'].append(dict(data['agenda_items'][0]))
+    data['issues'][0]['category'] = 'c2'
+    path = tmpdir.join('dump.json')
+    path.write(json.dumps(data))
+
+    importer = OpenAhjoImporter({'verbosity': 1, 'filename': str(path), 'flush': False, 'validate_only': True})
+    importer.import_data()
+
+    # the duplicate agenda item, the missing category and the content section of a missing agenda item
+    assert importer.validation.report(importer.logger) == 3
+    assert not Function.objects.exists()
+    assert not Action.objects.exists()
+
+
+@pytest.mark.django_db
+def test_open_ahjo_resume(tmpdir, organization, monkeypatch):
+    """
+    Test that a resumed import skips the stages and records committed by the interrupted one.
+    """
+    organization.origin_id = 'org1'
+    organization.save()
+    path = tmpdir.join('dump.json')
+    path.write(json.dumps(make_open_ahjo_data('org1')))
+    options = {'verbosity': 1, 'filename': str(path), 'flush': False, 'batch_size': 1}
+
+    imported = []
+    import_content = OpenAhjoImporter._import_content
+
+    def interrupted_import_content(importer, content_section_data):
+        if imported:
+            raise RuntimeError('interrupted')
+        imported.append(content_section_data['id'])
+        import_content(importer, content_section_data)
+
+    monkeypatch.setattr(OpenAhjoImporter, '_import_content', interrupted_import_content)
+    with pytest.raises(RuntimeError):
+        OpenAhjoImporter(options).import_data()
+
+    checkpoint = ImportCheckpoint.objects.get()
+    assert checkpoint.completed_stages == ['functions', 'events', 'case geometries', 'cases', 'actions']
+    assert (checkpoint.stage, checkpoint.position) == ('contents', 1)
+    assert Content.objects.count() == 1
+
+    def resumed_import_content(importer, content_section_data):
+        imported.append(content_section_data['id'])
+        import_content(importer, content_section_data)
+
+    monkeypatch.setattr(OpenAhjoImporter, '_import_content', resumed_import_content)
+    importer = OpenAhjoImporter(dict(options, resume=True))
+    importer.import_data()
+
+    assert imported == ['s1', 's2']
+    assert importer.get_upserter(Action).created == 0
+    assert Attachment.objects.count() == 1
+    assert not ImportCheckpoint.objects.exists()
+
+
+@pytest.mark.django_db
+def test_data_source_lock():
+    """
+    Test that a data source can only be imported by one import at a time.
+    """
+    with data_source_lock('oulu_tweb'):
+        with data_source_lock('vantaa_tweb'):
+            pass
+        with pytest.raises(ImportLocked):
+            with data_source_lock('oulu_tweb'):
+                pass
+
+    with data_source_lock('oulu_tweb'):
+        pass
+
+
+@pytest.mark.django_db
+def test_scraper_parent_in_later_unit(tmpdir):
+    """
+    Test that parents of organizations are set when their units are committed after those of their children.
+    """
+    OrganizationClass.objects.create(name='Lautakunta')
+    path = str(tmpdir.join('scraper.zip'))
+
+    def import_archive(organizations):
+        with zipfile.ZipFile(path, 'w') as archive:
+            for origin_id, parent in organizations:
+                archive.writestr('organizations/%s/index.json' % origin_id, json.dumps({
+                    'sourceId': origin_id, 'classification': 'lautakunta', 'name': origin_id,
+                    'founding_date': None, 'dissolution_date': None, 'parent': parent,
+                }))
+        # Every unit is committed in a batch of its own, the child first
+        importer = PaatosScraperImporter('test', {'name': 'Test'}, {
+            'verbosity': 1, 'batch_size': 1, 'flush': False, 'workers': 1, 'zipfile': path})
+        importer.import_data()
+        return importer
+
+    import_archive([('a-child', 'b-parent'), ('b-parent', None)])
+    child = Organization.objects.get(origin_id='a-child')
+    assert child.parent.origin_id == 'b-parent'
+    assert child.full_name == 'b-parent / a-child'
+    assert ImportManifest.objects.filter(data_source__identifier='test').exists()
+
+    # A parent missing altogether keeps the manifest from being saved, so the unit is retried next time
+    ImportManifest.objects.all().delete()
+    importer = import_archive([('a-child', 'missing')])
+    assert importer.errors == 1
+    assert Organization.objects.get(origin_id='a-child').parent is None
+    assert not ImportManifest.objects.exists()
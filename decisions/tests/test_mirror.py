@@ -0,0 +1,75 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from django.core.files.storage import FileSystemStorage
+
+from decisions.importer.mirror import AttachmentFetcher, ContentStore
+from decisions.models import Attachment
+
+FILES = {
+    '/a.pdf': b'%PDF-1.4 first',
+    '/copy-of-a.pdf': b'%PDF-1.4 first',
+    '/b.pdf': b'%PDF-1.4 second',
+}
+
+
+class AttachmentHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = FILES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def attachment_server():
+    server = HTTPServer(('127.0.0.1', 0), AttachmentHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    AttachmentHandler.requests = []
+    yield 'http://127.0.0.1:%d' % server.server_port
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.mark.django_db
+def test_mirror_attachments(action, attachment_server, tmpdir):
+    """
+    Test that attachments are stored once per content and not downloaded again when unchanged.
+    """
+    for number, path in enumerate(['/a.pdf', '/copy-of-a.pdf', '/b.pdf', '/missing.pdf'], 1):
+        Attachment.objects.create(action=action, number=number, public=True, url=attachment_server + path)
+    storage = FileSystemStorage(location=str(tmpdir))
+    fetcher = AttachmentFetcher(ContentStore(storage), workers=2, per_host=2, retries=0, timeout=5)
+
+    counts = fetcher.mirror(Attachment.objects.all())
+
+    assert (counts['stored'], counts['failed']) == (3, 1)
+    files = dict(Attachment.objects.values_list('url', 'file'))
+    assert files[attachment_server + '/a.pdf'] == files[attachment_server + '/copy-of-a.pdf']
+    assert len(set(files.values()) - {''}) == 2
+    with storage.open(files[attachment_server + '/b.pdf']) as stored:
+        assert stored.read() == FILES['/b.pdf']
+
+    counts = fetcher.mirror(Attachment.objects.all())
+    assert (counts['not modified'], counts['failed']) == (3, 1)
+    assert Attachment.objects.get(url=attachment_server + '/b.pdf').fetched_at is not None
@@ -0,0 +1,38 @@
+import pytest
+
+from decisions.models import Organization, Post
+
+
+@pytest.mark.django_db
+def test_organization_full_names(organization_factory, post_factory):
+    """
+    Test that full names are kept up to date on save and rebuilt after bulk updates.
+    """
+    root = organization_factory(name='City')
+    board = organization_factory(name='Board', parent=root)
+    division = organization_factory(name='Division', parent=board)
+    post = post_factory(label='Head', organization=division)
+    other = post_factory(label='Secretary', organization=organization_factory(name='Other'))
+    assert (division.full_name, division.depth) == ('City / Board / Division', 2)
+    assert str(post) == 'City / Board / Division / Head'
+
+    # Saving only touches the posts of the saved organization and its descendants
+    Post.objects.filter(pk=other.pk).update(full_name='')
+    board.name = 'Council'
+    board.save()
+    division.refresh_from_db()
+    post.refresh_from_db()
+    other.refresh_from_db()
+    assert str(division) == 'City / Council / Division'
+    assert str(post) == 'City / Council / Division / Head'
+    assert other.full_name == ''
+
+    Organization.objects.filter(pk=board.pk).update(parent=None)
+    Post.objects.filter(pk=post.pk).update(label='Chief')
+    assert Organization.rebuild_hierarchy() == 2
+    division.refresh_from_db()
+    post.refresh_from_db()
+    assert (division.full_name, division.depth) == ('Council / Division', 1)
+    assert str(post) == 'Council / Division / Chief'
+    other.refresh_from_db()
+    assert str(other) == 'Other / Secretary'
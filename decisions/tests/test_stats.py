@@ -0,0 +1,53 @@
+import json
+import time
+
+import pytest
+
+from decisions.importer.stats import ImportStats, timed
+from decisions.models import DataSource
+
+
+@pytest.mark.django_db
+def test_import_stats():
+    """
+    Test that stages record their rows and queries and that the report can be formatted.
+    """
+    counts = [0, 0, 0]
+    stats = ImportStats(lambda: tuple(counts))
+
+    with stats.measure('functions') as stage:
+        stats.add_read(3)
+        list(DataSource.objects.all())
+        counts[0] += 2
+        counts[2] += 1
+    stats.add_time('parse', 1.5)
+
+    assert (stage.rows_read, stage.rows_written, stage.rows_unchanged, stage.rows_skipped) == (3, 2, 0, 1)
+    assert stage.queries == 1
+    assert stats.stages['parse'].wall_time == 1.5
+    assert 'functions' in stats.format_table()
+    assert json.loads(json.dumps(stats.as_dict()))['total']['rows_read'] == 3
+
+
+class Parser(object):
+    def __init__(self):
+        self.timings = {}
+
+    @timed
+    def outer(self):
+        time.sleep(0.02)
+        self.inner()
+
+    @timed
+    def inner(self):
+        time.sleep(0.1)
+
+
+def test_timed_excludes_nested_time():
+    """
+    Test that time spent in nested timed methods is only added to their own timings.
+    """
+    parser = Parser()
+    parser.outer()
+    assert parser.timings['inner'] >= 0.1
+    assert 0.02 <= parser.timings['outer'] < 0.1
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from decisions.importer.streaming import JSONSectionReader
+
+DATA = {
+    'organizations': [{'origin_id': '1', 'name': 'Kaupunginvaltuusto'}],
+    'issues': [{'id': i, 'subject': 'Äänestys %d' % i, 'index': i * 1.5} for i in range(100)],
+    'empty': [],
+    'nested': [{'text': 'Brackets ] } [ { and "quotes" in \\ strings\\', 'items': [[1, {'a': None}], []]}],
+    'count': 100,
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024])
+def test_json_section_reader(tmpdir, chunk_size):
+    """
+    Test that streamed sections match the fully loaded document for any chunk size.
+    """
+    path = tmpdir.join('dump.json')
+    path.write_text(json.dumps(DATA, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    reader = JSONSectionReader(str(path), resident=('organizations',), chunk_size=chunk_size)
+
+    assert list(reader.keys()) == list(DATA.keys())
+    assert reader['organizations'] == DATA['organizations']
+    assert list(reader['issues']) == DATA['issues']
+    assert list(reader['empty']) == []
+    assert list(reader['nested']) == DATA['nested']
+    assert reader.load('count') == 100
@@ -98,12 +98,35 @@ LOGGING = {
 
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'decisions.api.pagination.DefaultPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_PERMISSION_CLASS': 'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.NamespaceVersioning',
 }
 
+# The API caches its responses until an import bumps the generation of a data source, see decisions.api.base.
+# The cache of each process is bounded by the number of responses kept.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 300,
+        },
+    },
+}
+
+# API responses pickling to more bytes than this are not cached, so the api cache above holds at most about
+# MAX_ENTRIES * 256 kB = 75 MB per process
+API_MAX_CACHED_RESPONSE_SIZE = 256 * 1024
+
+# List endpoints return the planner's estimate instead of an exact count for result sets estimated this large
+API_ESTIMATED_COUNT_THRESHOLD = 100000
+
 OPEN_AHJO_ATTACHMENT_URL_BASE = 'https://dev.hel.fi/paatokset'
 
 